@@ -0,0 +1,162 @@
+"""
+Cold-start import benchmark for the Streamlit app.
+
+Runs ``python -X importtime -c "import streamlit_app"`` in fresh interpreters,
+reports the total and the slowest top-level imports, and fails if the median
+exceeds a budget or if a heavy optional dependency is imported eagerly.
+
+Importing the module does not run ``main()``, so one script pass of the app is
+also run with ``streamlit.testing.v1.AppTest`` (with NCBI credentials set, as
+in a deployment) and checked for heavy imports as well.
+
+Usage:
+    python -m benchmarks.import_time [--repeat 5] [--budget-ms 2500] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that must only be imported when the feature using them runs
+LAZY_MODULES = ["openai", "anthropic", "Bio", "pdf2image", "pytesseract", "PyPDF2", "PIL", "httpx", "tiktoken"]
+
+def measure_once(module: str = "streamlit_app") -> Tuple[float, Dict[str, float], List[str]]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Args:
+        module: Module to import
+
+    Returns:
+        Tuple of (total_ms, cumulative_ms_by_direct_import, imported_modules)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    total_ms = 0.0
+    children = {}
+    direct_imports = {}
+    imported = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        imported.append(name.strip())
+        if depth == 1:
+            children[name.strip()] = int(cumulative_us) / 1000
+        elif depth == 0:
+            # A top-level entry is reported after everything it imported
+            if name.strip() == module:
+                total_ms = int(cumulative_us) / 1000
+                direct_imports = children
+            children = {}
+    return total_ms, direct_imports, imported
+
+# Runs the app once in a fresh interpreter and prints the modules the pass imported,
+# beyond those a trivial script pass already needs
+SCRIPT_PASS_CODE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+AppTest.from_string("import streamlit as st\\nst.write('')").run()
+before = set(sys.modules)
+start = time.perf_counter()
+app = AppTest.from_file("streamlit_app.py").run(timeout=60)
+print(json.dumps({
+    "ms": (time.perf_counter() - start) * 1000,
+    "modules": sorted(set(sys.modules) - before),
+    "exceptions": [str(exception.value) for exception in app.exception],
+}))
+"""
+
+def measure_script_pass() -> Tuple[float, List[str], List[str]]:
+    """
+    Run one script pass of streamlit_app in a fresh interpreter with AppTest
+
+    Returns:
+        Tuple of (pass_ms, imported_modules, exceptions shown by the app)
+    """
+    env = dict(os.environ, NCBI_EMAIL=os.environ.get("NCBI_EMAIL", "benchmark@example.org"),
+               NCBI_API_KEY=os.environ.get("NCBI_API_KEY", "benchmark"))
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT_PASS_CODE],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Script pass of streamlit_app failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result["ms"], result["modules"], result["exceptions"]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="streamlit_app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2500.0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--no-script-pass", action="store_true", help="Only measure the import, not a script pass")
+    args = parser.parse_args()
+
+    runs = [measure_once(args.module) for _ in range(args.repeat)]
+    totals = [total for total, _, _ in runs]
+    median_ms = statistics.median(totals)
+    _, direct_imports, imported = runs[-1]
+    slowest = sorted(direct_imports.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    eager = sorted({name.split(".")[0] for name in imported} & set(LAZY_MODULES))
+
+    result = {
+        "module": args.module,
+        "runs": args.repeat,
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "budget_ms": args.budget_ms,
+        "slowest_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in slowest],
+        "eager_heavy_imports": eager,
+    }
+    if not args.no_script_pass:
+        pass_ms, pass_imported, exceptions = measure_script_pass()
+        result["script_pass"] = {
+            "ms": round(pass_ms, 1),
+            "eager_heavy_imports": sorted({name.split(".")[0] for name in pass_imported} & set(LAZY_MODULES)),
+            "exceptions": exceptions,
+        }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import {args.module}: median {result['median_ms']} ms "
+              f"(min {result['min_ms']}, max {result['max_ms']}, {args.repeat} runs, budget {args.budget_ms} ms)")
+        for name, ms in slowest:
+            print(f"  {ms:9.1f} ms  {name}")
+        if eager:
+            print(f"Heavy modules imported at start-up: {', '.join(eager)}")
+        if "script_pass" in result:
+            script_pass = result["script_pass"]
+            print(f"script pass: {script_pass['ms']} ms")
+            if script_pass["eager_heavy_imports"]:
+                print(f"Heavy modules imported by the first script pass: {', '.join(script_pass['eager_heavy_imports'])}")
+            for exception in script_pass["exceptions"]:
+                print(f"Exception in the script pass: {exception}")
+
+    script_pass = result.get("script_pass", {})
+    if eager or median_ms > args.budget_ms or script_pass.get("eager_heavy_imports") or script_pass.get("exceptions"):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
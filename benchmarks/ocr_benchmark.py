@@ -0,0 +1,97 @@
+"""
+OCR speed and accuracy benchmark.
+
+OCRs generated fixture scans (image-only PDFs and photos, see
+``benchmarks.fixtures``) through ``extract_text`` with and without the
+preprocessing in ``utils.pdf_utils.preprocess_for_ocr``, and reports pages/sec
+and character accuracy (difflib similarity to the text the fixtures were
+rendered from). Needs tesseract and poppler.
+
+Usage:
+    python -m benchmarks.ocr_benchmark --files 5
+    python -m benchmarks.ocr_benchmark --kinds photo --skew 3 --psm 6 --oem 1
+    python -m benchmarks.ocr_benchmark --output ocr.json
+"""
+import argparse
+import difflib
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks import fixtures
+from config import DEFAULT_CONFIG
+
+KINDS = ["scanned", "photo"]
+
+def normalize(text: str) -> str:
+    """Collapse whitespace, so layout differences do not count as OCR errors"""
+    return re.sub(r"\s+", " ", text).strip()
+
+def accuracy(text: str, truth: str) -> float:
+    """Similarity of OCR output to the ground truth, from 0 to 1"""
+    return difflib.SequenceMatcher(None, normalize(text), normalize(truth), autojunk=False).ratio()
+
+def run(kind: str, preprocess: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    """OCR the fixtures of one kind and return the measurements"""
+    from utils.pdf_utils import extract_text
+
+    DEFAULT_CONFIG["ocr"].update(preprocess=preprocess, psm=args.psm, oem=args.oem)
+    render_options = {"skew_degrees": args.skew, "noise": args.noise}
+    if kind == "scanned":
+        render_options["dpi"] = args.scan_dpi
+    files = fixtures.sample_files(kind, args.files, **render_options)
+
+    pages = 0
+    scores: List[float] = []
+    start = time.perf_counter()
+    for index, fixture in enumerate(files):
+        processed = extract_text(fixture.name, fixture.getvalue(), use_ocr=True, language="eng")
+        pages += processed['page_count']
+        lines = fixtures.sample_paper_lines(index)
+        # Photos show the first page only
+        truth = "\n".join(lines[:45] if kind == "photo" else lines)
+        scores.append(accuracy(processed['content'], truth))
+    wall = time.perf_counter() - start
+    return {
+        "kind": kind,
+        "preprocess": preprocess,
+        "files": len(files),
+        "pages": pages,
+        "wall_s": round(wall, 2),
+        "pages_per_s": round(pages / wall, 3) if wall else 0.0,
+        "accuracy": round(sum(scores) / len(scores), 4) if scores else 0.0,
+        "min_accuracy": round(min(scores), 4) if scores else 0.0,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", default="scanned,photo")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--scan-dpi", type=int, default=200, help="Resolution the scanned PDFs are rendered at")
+    parser.add_argument("--skew", type=float, default=1.5, help="Page rotation in degrees")
+    parser.add_argument("--noise", type=float, default=0.002, help="Share of speckle pixels")
+    parser.add_argument("--psm", type=int, default=DEFAULT_CONFIG["ocr"]["psm"], help="Tesseract page segmentation mode")
+    parser.add_argument("--oem", type=int, default=DEFAULT_CONFIG["ocr"]["oem"], help="Tesseract engine mode")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.kinds.split(","):
+        if kind not in KINDS:
+            parser.error(f"Unknown kind {kind!r}; choose from {', '.join(KINDS)}")
+        for preprocess in (False, True):
+            results.append(run(kind, preprocess, args))
+
+    print(f"{'kind':<9} {'preprocess':<11} {'pages':>5} {'pages/s':>8} {'accuracy':>9} {'min':>7}")
+    for result in results:
+        print(f"{result['kind']:<9} {'on' if result['preprocess'] else 'off':<11} {result['pages']:>5} "
+              f"{result['pages_per_s']:>8} {result['accuracy']:>9.2%} {result['min_accuracy']:>7.2%}")
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Offline throughput/latency benchmark for AnalysisService.
+
+Runs ``analyze_pubmed_papers`` on recorded efetch fixtures and
+``analyze_pdf_files`` on generated PDFs against the local stub LLM server,
+each scenario in its own interpreter so peak RSS is measured per scenario.
+Reports papers/min, p50/p95 latency per stage (from the service's run
+metrics), token usage and peak RSS.
+
+Scenarios: pubmed, pdf-digital, pdf-scanned (OCR, needs tesseract/poppler),
+photo (OCR).
+
+Usage:
+    python -m benchmarks.run_pipeline --scenarios pubmed,pdf-digital --papers 40 --latency-ms 500
+    python -m benchmarks.run_pipeline --output before.json
+    python -m benchmarks.run_pipeline --compare before.json --max-regression 10
+    python -m benchmarks.run_pipeline --papers 60 --latency-sigma 1.0 --hedging --failover
+"""
+import argparse
+import json
+import logging
+import math
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.stub_llm_server import add_stub_arguments, start_stub_server, stub_config_from_args
+
+SCENARIOS = ["pubmed", "pdf-digital", "pdf-scanned", "photo"]
+
+def benchmark_state() -> Dict[str, Any]:
+    """Fresh stand-in for st.session_state with the keys initialize_session_state sets"""
+    return {
+        'analysis_results': [],
+        'progress': 0,
+        'total_papers': 0,
+        'search_completed': False,
+        'pdf_texts': [],
+        'pdf_analysis_completed': False,
+        'run_metrics': None,
+        'dedup_index': None,
+        'results_query': None,
+    }
+
+def create_stub_client(provider: str, base_url: str, max_retries: int) -> Any:
+    from utils.api_utils import create_http_client
+    if provider == "openai":
+        import openai
+        return openai.OpenAI(api_key="stub", base_url=f"{base_url}/v1", http_client=create_http_client(provider), max_retries=max_retries)
+    from anthropic import Anthropic
+    return Anthropic(api_key="stub", base_url=base_url, http_client=create_http_client(provider), max_retries=max_retries)
+
+def run_scenario(scenario: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one scenario in this process and return its measurements"""
+    from benchmarks import fixtures
+    from services import analysis_service
+    from services.analysis_service import AnalysisService
+
+    server, base_url = start_stub_server(stub_config_from_args(args))
+    client = create_stub_client(args.provider, base_url, args.max_retries)
+    state = benchmark_state()
+    # The stub serves both APIs, so the failover client can point at the same server
+    fallback_provider = "anthropic" if args.provider == "openai" else "openai"
+    fallback_client = create_stub_client(fallback_provider, base_url, args.max_retries) if args.failover else None
+    service = AnalysisService(
+        client, args.provider, args.model, state=state, cascade=args.cascade,
+        fallback_client=fallback_client, hedging=args.hedging
+    )
+
+    try:
+        if scenario == "pubmed":
+            records = fixtures.load_efetch_records(args.fixture, copies=math.ceil(args.papers / 8))
+            records['PubmedArticle'] = records['PubmedArticle'][:args.papers]
+            # Serve the recorded efetch result instead of calling NCBI
+            analysis_service.search_and_fetch_pubmed = lambda query, max_results: records
+            start = time.perf_counter()
+            from config import DEFAULT_CONFIG
+            prefilter = DEFAULT_CONFIG["pubmed_prefilter"] if args.prefilter else None
+            service.analyze_pubmed_papers("benchmark", args.papers, prefilter=prefilter)
+        else:
+            kind = {"pdf-digital": "digital", "pdf-scanned": "scanned", "photo": "photo"}[scenario]
+            files = fixtures.sample_files(kind, args.papers)
+            start = time.perf_counter()
+            service.analyze_pdf_files(files, use_ocr=kind != "digital", language="eng")
+        wall = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    analyzed = len(state['analysis_results'])
+    run_metrics = state['run_metrics']
+    return {
+        "scenario": scenario,
+        "provider": args.provider,
+        "papers": args.papers,
+        "analyzed": analyzed,
+        "wall_s": round(wall, 2),
+        "papers_per_min": round(analyzed / wall * 60, 1) if wall else 0.0,
+        "stages": run_metrics['stages'],
+        "input_tokens": run_metrics['input_tokens'],
+        "output_tokens": run_metrics['output_tokens'],
+        "retries": run_metrics['retries'],
+        "cascade": run_metrics['cascade'],
+        "pipeline": run_metrics['pipeline'],
+        "counters": run_metrics['counters'],
+        # ru_maxrss is reported in kilobytes on Linux; children are the PDF extraction processes
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stub": server.stub_state.snapshot(),
+    }
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        print(f"\n== {result['scenario']} ({result['provider']}) ==")
+        print(f"  analyzed     {result['analyzed']}/{result['papers']} in {result['wall_s']} s")
+        print(f"  throughput   {result['papers_per_min']} papers/min")
+        print(f"  peak RSS     {result['peak_rss_mb']} MB (largest extraction process {result['peak_rss_children_mb']} MB)")
+        print(f"  tokens       {result['input_tokens']} in / {result['output_tokens']} out, {result['retries']} retries")
+        for stage, stats in result["stages"].items():
+            print(f"  {stage:<12} p50 {stats['p50_ms']:>8} ms   p95 {stats['p95_ms']:>8} ms   n={stats['count']}")
+        for stage, stats in (result.get("pipeline") or {}).items():
+            print(f"  {stage:<12} {stats['workers']} workers, {stats['utilization']:.0%} busy, "
+                  f"{stats['starved_s']} s starved, {stats['blocked_s']} s blocked")
+        if result.get("cascade"):
+            cascade = result["cascade"]
+            print(f"  cascade      {cascade['escalated']}/{cascade['triaged']} escalated, "
+                  f"est. {cascade['estimated_latency_saved_s']} s / ${cascade['estimated_cost_saved_usd']} saved")
+        counters = result.get("counters") or {}
+        if counters.get("hedges_fired") or counters.get("failovers"):
+            print(f"  hedging      {counters.get('hedges_fired', 0)} hedges, {counters.get('hedges_won', 0)} won, "
+                  f"{counters.get('failovers', 0)} failovers")
+        stub = result["stub"]
+        print(f"  stub server  {stub['requests']} requests, {stub['rate_limited']} x 429, {stub['errors']} x 5xx")
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> bool:
+    """Print throughput/RSS deltas against a saved run; return False if any regressed too far"""
+    with open(baseline_path) as handle:
+        baseline = {result["scenario"]: result for result in json.load(handle)}
+    ok = True
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if not before:
+            continue
+        for metric, higher_is_better in (("papers_per_min", True), ("peak_rss_mb", False)):
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            regressed = -change if higher_is_better else change
+            flag = "  REGRESSION" if regressed > max_regression else ""
+            ok = ok and not flag
+            print(f"  {result['scenario']:<12} {metric:<15} {old:>8} -> {new:>8} ({change:+.1f}%){flag}")
+    return ok
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="pubmed,pdf-digital")
+    parser.add_argument("--papers", type=int, default=20)
+    parser.add_argument("--provider", choices=["openai", "anthropic"], default="openai")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--fixture", default="efetch_loratadine.xml")
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--cascade", action="store_true", help="Use the cheap-model cascade")
+    parser.add_argument("--hedging", action="store_true", help="Hedge calls slower than DEFAULT_CONFIG['hedging']['percentile']")
+    parser.add_argument("--failover", action="store_true", help="Give the service a client for the other provider")
+    parser.add_argument("--prefilter", action="store_true", help="Apply DEFAULT_CONFIG['pubmed_prefilter'] to PubMed records")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Compare with a JSON file written by --output")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    if args.model is None:
+        from config import DEFAULT_CONFIG
+        args.model = DEFAULT_CONFIG["default_openai_model" if args.provider == "openai" else "default_claude_model"]
+
+    if args.child:
+        logging.getLogger("streamlit").setLevel(logging.ERROR)
+        print(json.dumps(run_scenario(args.scenarios, args)))
+        return 0
+
+    results = []
+    for scenario in args.scenarios.split(","):
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario {scenario!r}; choose from {', '.join(SCENARIOS)}")
+        # A fresh interpreter per scenario keeps peak RSS comparable
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run_pipeline", *sys.argv[1:], "--scenarios", scenario, "--child"],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            print(f"Scenario {scenario} failed:\n{proc.stderr[-3000:]}", file=sys.stderr)
+            return 1
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""
+Local stub of the OpenAI and Anthropic HTTP APIs for offline benchmarks.
+
+Serves ``POST /v1/chat/completions``, ``POST /v1/messages`` and
+``GET /v1/models`` with a canned extraction result, after a configurable
+(log-normally distributed) latency. A share of requests can be failed with
+5xx errors or 429 rate limits, and requests above ``max_concurrency`` are
+rejected with 429 like a real provider under load. Requests with
+``"stream": true`` are answered with server-sent events in each provider's
+format; a share of streams can stall part-way to exercise stall detection.
+``GET /stats`` returns request counters as JSON.
+
+Usage:
+    python -m benchmarks.stub_llm_server --port 8765 --latency-ms 800 --error-rate 0.02
+
+Point the SDK clients at it with ``base_url="http://127.0.0.1:8765/v1"``
+(OpenAI) or ``base_url="http://127.0.0.1:8765"`` (Anthropic).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_STUB_CONFIG = {
+    "latency_ms": 800.0,       # median response latency
+    "latency_sigma": 0.5,      # log-normal sigma; larger values give a longer tail
+    "error_rate": 0.0,         # share of requests answered with HTTP 500
+    "rate_limit_rate": 0.0,    # share of requests answered with HTTP 429
+    "retry_after": 1,          # Retry-After header sent with 429 responses
+    "max_concurrency": 0,      # reject requests above this many in flight with 429 (0 = unlimited)
+    "incomplete_rate": 0.0,    # share of answers with empty results fields (exercises cascade escalation)
+    "small_model_factor": 0.3, # latency multiplier for small models (haiku, gpt-3.5, *-mini)
+    "stall_rate": 0.0,         # share of streamed answers that stop sending data part-way
+    "stall_seconds": 120.0,    # how long a stalled stream stays silent before finishing
+    "stream_chunks": 20,       # number of text chunks a streamed answer is split into
+    "seed": None,
+}
+
+PMID_PATTERN = re.compile(r"PMID\W+(?:StringElement\(\W*)?(\d+)")
+TITLE_PATTERN = re.compile(r"ArticleTitle\W+(?:StringElement\(\W*)?([^'\"]+)")
+SMALL_MODEL_PATTERN = re.compile(r"haiku|gpt-3\.5|mini", re.IGNORECASE)
+OMIT_PATTERN = re.compile(r"Do not return these fields[^:]*:\s*([^\n]+)")
+
+def build_extraction(prompt: str, incomplete: bool = False) -> Dict[str, Any]:
+    """Return a plausible extraction result, echoing the PMID and title found in the prompt"""
+    pmid = PMID_PATTERN.search(prompt)
+    title = TITLE_PATTERN.search(prompt)
+    result = {
+        "Title": title.group(1) if title else "Stub clinical trial",
+        "PMID": pmid.group(1) if pmid else "NA",
+        "Full Text Link": "NA",
+        "Subject of Study": "Human",
+        "Disease State": "Seasonal allergic rhinitis",
+        "Number of Subjects Studied": 120,
+        "Type of Study": "RCT",
+        "Study Design": "Randomized, double-blind, placebo-controlled",
+        "Intervention": "Loratadine",
+        "Intervention Dose": "10 mg once daily for 2 weeks",
+        "Intervention Dosage Form": "Oral",
+        "Control": "Placebo",
+        "Primary Endpoint": "Change in total nasal symptom score",
+        "Primary Endpoint Result": "-2.1 vs -0.9",
+        "Secondary Endpoints": "Quality of life",
+        "Safety Endpoints": "Adverse events",
+        "Results Available": "Yes",
+        "Primary Endpoint Met": "Yes",
+        "Statistical Significance": "p<0.01",
+        "Clinical Significance": "NA",
+        "Conclusion": "Loratadine improved symptoms versus placebo.",
+        "Main Author": "Doe, J",
+        "Other Authors": "Roe, R",
+        "Journal Name": "Journal of Stub Studies",
+        "Date of Publication": "2023-01-01",
+        "Error": "",
+    }
+    if incomplete:
+        result["Primary Endpoint Result"] = ""
+        result["Primary Endpoint Met"] = ""
+    return result
+
+class StubState:
+    """Thread-safe configuration, random source and counters shared by the handlers"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_STUB_CONFIG, **(config or {})}
+        self.random = random.Random(self.config["seed"])
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "max_in_flight": 0}
+
+    def admit(self, model: str = "") -> Tuple[str, float, bool, bool]:
+        """Decide the outcome ("ok", "rate_limited" or "error"), latency, completeness and stalling of a new request"""
+        with self.lock:
+            self.stats["requests"] += 1
+            limit = self.config["max_concurrency"]
+            if limit and self.in_flight >= limit:
+                outcome = "rate_limited"
+            else:
+                roll = self.random.random()
+                if roll < self.config["rate_limit_rate"]:
+                    outcome = "rate_limited"
+                elif roll < self.config["rate_limit_rate"] + self.config["error_rate"]:
+                    outcome = "error"
+                else:
+                    outcome = "ok"
+            latency = self.config["latency_ms"] * self.random.lognormvariate(0, self.config["latency_sigma"])
+            if SMALL_MODEL_PATTERN.search(model):
+                latency *= self.config["small_model_factor"]
+            incomplete = self.random.random() < self.config["incomplete_rate"]
+            stall = self.random.random() < self.config["stall_rate"]
+            self.stats[outcome if outcome != "error" else "errors"] += 1
+            if outcome == "ok":
+                self.in_flight += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        return outcome, latency / 1000, incomplete, stall
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, "in_flight": self.in_flight}
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "StubLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Keep benchmark output clean
+        pass
+
+    @property
+    def state(self) -> StubState:
+        return self.server.stub_state
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_events(self, events: List[Tuple[Optional[str], Any]], delay: float, stall_at: Optional[int]) -> None:
+        """Stream (event name, data) pairs as server-sent events, spreading delay across them"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # No Content-Length: the end of the stream is the end of the connection
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for position, (name, data) in enumerate(events):
+                if position == stall_at:
+                    time.sleep(self.state.config["stall_seconds"])
+                lines = f"event: {name}\n" if name else ""
+                lines += f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+                self.wfile.write(lines.encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled or timed out the stream
+            pass
+
+    def _openai_events(self, model: str, text: str, input_tokens: int, output_tokens: int) -> List[Tuple[Optional[str], Any]]:
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(choices: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+            return {"id": chunk_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": choices, "usage": usage}
+
+        events = [(None, chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))]
+        events += [
+            (None, chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+            for piece in _split_text(text, self.state.config["stream_chunks"])
+        ]
+        events.append((None, chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])))
+        events.append((None, chunk([], {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })))
+        events.append((None, "[DONE]"))
+        return events
+
+    def _anthropic_events(self, model: str, text: str, input_tokens: int, output_tokens: int) -> List[Tuple[Optional[str], Any]]:
+        events = [("message_start", {"type": "message_start", "message": {
+            "id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+        }})]
+        events.append(("content_block_start", {"type": "content_block_start", "index": 0,
+                                               "content_block": {"type": "text", "text": ""}}))
+        events += [
+            ("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                     "delta": {"type": "text_delta", "text": piece}})
+            for piece in _split_text(text, self.state.config["stream_chunks"])
+        ]
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": 0}))
+        events.append(("message_delta", {"type": "message_delta",
+                                         "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                         "usage": {"output_tokens": output_tokens}}))
+        events.append(("message_stop", {"type": "message_stop"}))
+        return events
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.snapshot())
+        elif self.path.startswith("/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.startswith("/v1/chat/completions"):
+            provider = "openai"
+        elif self.path.startswith("/v1/messages"):
+            provider = "anthropic"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        outcome, latency, incomplete, stall = self.state.admit(request.get("model", ""))
+        if outcome == "rate_limited":
+            self._send_json(
+                429,
+                {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limit exceeded (stub)"}},
+                {"retry-after": str(self.state.config["retry_after"])},
+            )
+            return
+        if outcome == "error":
+            time.sleep(latency / 4)
+            self._send_json(500, {"type": "error", "error": {"type": "api_error", "message": "Internal error (stub)"}})
+            return
+
+        try:
+            streaming = bool(request.get("stream"))
+            # A streamed answer starts after a fifth of the latency and spreads the rest over its chunks
+            time.sleep(latency / 5 if streaming else latency)
+            prompt = json.dumps(request.get("messages", []))
+            extraction = build_extraction(prompt, incomplete)
+            # Honour the prompt's list of fields filled in from PubMed metadata
+            omitted = OMIT_PATTERN.search(prompt + str(request.get("system", "")))
+            for field in (omitted.group(1).split(", ") if omitted else []):
+                extraction.pop(field.strip(), None)
+            text = json.dumps(extraction)
+            input_tokens = (len(prompt) + len(str(request.get("system", "")))) // 4
+            output_tokens = len(text) // 4
+            model = request.get("model", "stub-model")
+            if streaming:
+                if provider == "openai":
+                    events = self._openai_events(model, text, input_tokens, output_tokens)
+                else:
+                    events = self._anthropic_events(model, text, input_tokens, output_tokens)
+                stall_at = len(events) // 2 if stall else None
+                self._send_events(events, latency * 0.8 / len(events), stall_at)
+                return
+            if provider == "openai":
+                body = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": input_tokens,
+                        "completion_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                }
+            else:
+                body = {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+                }
+            self._send_json(200, body)
+        finally:
+            self.state.release()
+
+def _split_text(text: str, pieces: int) -> List[str]:
+    size = max(1, -(-len(text) // max(1, pieces)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def start_stub_server(
+    config: Optional[Dict[str, Any]] = None,
+    host: str = "127.0.0.1",
+    port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stub server in a daemon thread
+
+    Args:
+        config: Overrides for DEFAULT_STUB_CONFIG
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+
+    Returns:
+        Tuple of (server, base_url); call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub_state = StubState(config)
+    thread = threading.Thread(target=server.serve_forever, name="stub-llm-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the stub server options to an argument parser"""
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_STUB_CONFIG["latency_ms"])
+    parser.add_argument("--latency-sigma", type=float, default=DEFAULT_STUB_CONFIG["latency_sigma"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_STUB_CONFIG["error_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=DEFAULT_STUB_CONFIG["rate_limit_rate"])
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_STUB_CONFIG["retry_after"])
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_STUB_CONFIG["max_concurrency"])
+    parser.add_argument("--incomplete-rate", type=float, default=DEFAULT_STUB_CONFIG["incomplete_rate"])
+    parser.add_argument("--small-model-factor", type=float, default=DEFAULT_STUB_CONFIG["small_model_factor"])
+    parser.add_argument("--stall-rate", type=float, default=DEFAULT_STUB_CONFIG["stall_rate"])
+    parser.add_argument("--stall-seconds", type=float, default=DEFAULT_STUB_CONFIG["stall_seconds"])
+    parser.add_argument("--stream-chunks", type=int, default=DEFAULT_STUB_CONFIG["stream_chunks"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_STUB_CONFIG["seed"])
+
+def stub_config_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """Build a stub config from parsed add_stub_arguments() options"""
+    return {key: getattr(args, key) for key in DEFAULT_STUB_CONFIG}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(stub_config_from_args(args), args.host, args.port)
+    print(f"Stub LLM server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
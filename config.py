@@ -11,23 +11,153 @@ DEFAULT_CONFIG = {
     "openai_models": {
         "gpt-4o": "GPT-4o",
         "gpt-4-turbo": "GPT-4 Turbo",
-        "gpt-3.5-turbo": "GPT-3.5 Turbo"
+        "gpt-3.5-turbo": "GPT-3.5 Turbo",
+        "auto": "Auto (cheapest model that fits)"
     },
     "claude_models": {
         "claude-3-opus-20240229": "Claude 3 Opus",
         "claude-3-sonnet-20240229": "Claude 3 Sonnet",
-        "claude-3-haiku-20240307": "Claude 3 Haiku"
+        "claude-3-haiku-20240307": "Claude 3 Haiku",
+        "auto": "Auto (cheapest model that fits)"
     },
     "default_openai_model": "gpt-4o",
     "default_claude_model": "claude-3-sonnet-20240229",
+    # Cheap models used for first-pass extraction in cascade mode
+    "cascade_models": {
+        "openai": "gpt-3.5-turbo",
+        "anthropic": "claude-3-haiku-20240307"
+    },
     "max_pubmed_results": 400,
     "default_pubmed_results": 20,
+    # Rules applied to efetch records before any LLM call (see utils.pubmed_utils.prefilter_records)
+    "pubmed_prefilter": {
+        "require_abstract": True,
+        "exclude_publication_types": [
+            "Published Erratum",
+            "Comment",
+            "Editorial",
+            "Letter",
+            "News",
+            "Retraction of Publication",
+            "Retracted Publication",
+        ],
+        "include_publication_types": [],  # empty allows any type
+        "exclude_non_human": False,       # MeSH 'Animals' without 'Humans'
+        "languages": [],                  # MEDLINE codes or names from pubmed_languages, e.g. ["eng"]; empty allows any
+    },
+    # PubMed <Language> values are MEDLINE codes, which differ from the Tesseract codes in supported_languages
+    "pubmed_languages": {
+        'English': 'eng',
+        'French': 'fre',
+        'Spanish': 'spa',
+        'German': 'ger',
+        'Italian': 'ita',
+        'Portuguese': 'por',
+        'Arabic': 'ara',
+        'Chinese': 'chi',
+        'Japanese': 'jpn',
+        'Russian': 'rus',
+    },
     "supported_languages": {
         'English': 'eng',
         'French': 'fra',
         'Arabic': 'ara',
         'Spanish': 'spa',
-    }
+    },
+    # Cached API clients (one per validated key); each holds its own connection pool
+    "api_client_cache": {
+        "max_entries": 20,
+        "ttl": 24 * 3600,  # seconds
+    },
+    # Shared HTTP connection pool used by the cached API clients
+    "http_pool": {
+        "max_connections": 20,
+        "max_keepalive_connections": 10,
+        "keepalive_expiry": 60.0,
+        "connect_timeout": 10.0,
+    },
+    # Overlapped PDF ingestion: extraction processes feed LLM analysis threads through bounded queues
+    "pdf_pipeline": {
+        "extract_workers": 0,   # processes for text extraction/OCR; 0 uses the CPU count (max 4)
+        "analysis_workers": 4,  # concurrent LLM calls
+        "queue_size": 4,        # extracted files waiting for analysis before extraction pauses
+    },
+    # OCR of scanned PDFs and photos (see utils.pdf_utils.preprocess_for_ocr)
+    "ocr": {
+        "preprocess": True,          # grayscale, contrast, deskew, rescale and binarize pages before OCR
+        "deskew": True,
+        "max_skew_degrees": 5.0,
+        "target_text_height": 30,    # pixels of ink per text line (about 10 pt text at 300 dpi); Tesseract reads best near this
+        "probe_dpi": 72,             # PDFs: page 1 is rendered at this resolution to measure the text size
+        "min_dpi": 150,
+        "max_dpi": 400,
+        "default_dpi": 300,          # used when no text lines are found on the probe page
+        "psm": 3,                    # Tesseract page segmentation mode (3 = automatic, 6 = one block of text)
+        "oem": 3,                    # Tesseract engine mode (1 = LSTM only, 3 = default)
+    },
+    # Concurrent LLM requests allowed across all sessions of this server (0 or missing = unlimited)
+    "llm_concurrency": {
+        "providers": {"openai": 8, "anthropic": 4},
+        "models": {"gpt-4o": 4, "gpt-4-turbo": 2, "claude-3-opus-20240229": 2},
+    },
+    # Results shared across sessions: identical requests are answered once
+    "shared_results": {
+        "max_entries": 2000,
+        "ttl": 86400,  # seconds
+    },
+    # Hedged requests: a call still running after this latency percentile of recent calls gets a duplicate,
+    # and the first answer wins. "target" is "same" (same provider and model) or "fallback" (the other
+    # provider's default model, when a failover key is set; otherwise the same model).
+    "hedging": {
+        "percentile": 95,
+        "min_samples": 20,   # recent calls needed before hedging starts
+        "window": 200,       # recent call latencies kept per provider and model
+        "min_delay": 2.0,    # never hedge sooner than this many seconds
+        "target": "fallback",
+    },
+    # Failover to the other provider after sustained 5xx/429 responses (needs a failover key)
+    "failover": {
+        "failures": 5,       # failed calls within the window that open the circuit
+        "window": 60.0,      # seconds
+        "cooldown": 120.0,   # seconds the other provider is used before the primary is tried again
+    },
+    # Streaming LLM calls: total time allowed per request, and longest gap between chunks
+    "llm_request_timeout": 180.0,
+    "llm_stall_timeout": 45.0,
+    # Seconds a successful API key validation is reused before re-checking
+    "api_key_validation_ttl": 3600,
+    # USD per 1M tokens (input, output), used for cost estimates in run metrics
+    "model_pricing": {
+        "gpt-4o": (5.00, 15.00),
+        "gpt-4-turbo": (10.00, 30.00),
+        "gpt-3.5-turbo": (0.50, 1.50),
+        "claude-3-opus-20240229": (15.00, 75.00),
+        "claude-3-sonnet-20240229": (3.00, 15.00),
+        "claude-3-haiku-20240307": (0.25, 1.25),
+    },
+    # (context window, maximum output tokens) per model, checked locally before each call
+    "model_limits": {
+        "gpt-4o": (128000, 4096),
+        "gpt-4-turbo": (128000, 4096),
+        "gpt-3.5-turbo": (16385, 4096),
+        "claude-3-opus-20240229": (200000, 4096),
+        "claude-3-sonnet-20240229": (200000, 4096),
+        "claude-3-haiku-20240307": (200000, 4096),
+        "default": (16385, 4096),
+    },
+    # Local token accounting (see utils.token_utils)
+    "token_budget": {
+        "chars_per_token": 3.5,    # estimate for models tiktoken does not cover; errs towards more tokens
+        "message_overhead": 50,    # chat formatting tokens around the messages
+        "output_per_field": 80,    # answer tokens reserved per extracted field
+        "output_overhead": 200,    # JSON punctuation and slack
+    },
+    # Local data such as saved queries; keep it out of version control
+    "data_dir": os.environ.get("CLARA_DATA_DIR", ".clara"),
+    # Extracted PDF texts are kept on disk under data_dir and removed after this many days
+    "text_store_max_age_days": 7,
+    # Port for the Prometheus-style /metrics endpoint (0 disables it)
+    "metrics_port": int(os.environ.get("CLARA_METRICS_PORT", 0)),
 }
 
 # Environment variables or secrets
@@ -1,24 +1,461 @@
 import streamlit as st
-from typing import List, Dict, Any, Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Callable, Optional, Set, Tuple, Union, TYPE_CHECKING
 import logging
-from openai import OpenAI
-from anthropic import Anthropic
-from utils.openai_utils import analyze_paper_with_openai
-from utils.claude_utils import analyze_paper_with_claude
-from utils.pubmed_utils import search_and_fetch_pubmed
-from utils.pdf_utils import process_file
+import re
+import threading
+import time
+from utils.openai_utils import analyze_paper_with_openai, get_analysis_prompt as get_openai_prompt
+from utils.claude_utils import analyze_paper_with_claude, get_analysis_prompt as get_claude_prompt
+from utils.pubmed_utils import (
+    ESEARCH_MAX_IDS,
+    search_and_fetch_pubmed,
+    search_pubmed_ids,
+    fetch_pubmed_records,
+    prefilter_records,
+    extract_record_metadata,
+    deterministic_fields
+)
+from utils.saved_query_utils import load_saved_query, save_query
+from utils.pdf_utils import extract_file_worker
+from utils.metrics_utils import PaperMetrics, RunMetrics
+from utils.dedup_utils import DedupIndex, record_keys, result_keys, text_keys
+from utils.cascade_utils import triage_failures
+from utils.streaming_utils import CancelToken, OutputTruncated, StreamStalled, request_deadline
+from utils.storage_utils import get_text_store
+from utils.shared_store_utils import LIMITER, RESULT_STORE, request_key
+from utils.hedging_utils import LATENCY, get_breaker, hedged_call, is_provider_failure
+from utils.pipeline_utils import Pipeline, PipelineError, default_process_workers, get_process_pool, run_in_process
+from utils.token_utils import AUTO_MODEL, fit_content, fits, model_limits, output_budget, select_model
+from utils.ui_utils import display_cancel_button
+from config import DEFAULT_CONFIG
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from anthropic import Anthropic
 
 logger = logging.getLogger(__name__)
 
 class AnalysisService:
     """Service for analyzing papers from PubMed or PDFs"""
     
-    def __init__(self, client: Union[OpenAI, Anthropic], provider: str = "openai", model: str = None):
+    def __init__(
+        self,
+        client: Union["OpenAI", "Anthropic"],
+        provider: str = "openai",
+        model: str = None,
+        state: Optional[Dict[str, Any]] = None,
+        cascade: bool = False,
+        run_time_limit: float = 0,
+        fallback_client: Optional[Union["OpenAI", "Anthropic"]] = None,
+        hedging: bool = False
+    ):
         self.client = client
         self.provider = provider.lower()
         self.model = model
+        # Client for the other provider, used for failover and (with target "fallback") hedged requests
+        self.fallback_client = fallback_client
+        self.fallback_provider = "anthropic" if self.provider == "openai" else "openai"
+        # Send a duplicate of calls slower than the configured latency percentile (DEFAULT_CONFIG["hedging"])
+        self.hedging = hedging
+        # In cascade mode a cheap model extracts first and self.model only sees papers failing the checks
+        # (Auto mode already picks the cheapest model that fits, so it has no cascade)
+        triage_model = DEFAULT_CONFIG["cascade_models"].get(self.provider) if cascade and model != AUTO_MODEL else None
+        self.triage_model = triage_model if triage_model != model else None
+        # Defaults to st.session_state; a plain dict lets the service run outside Streamlit (e.g. benchmarks)
+        self.state = st.session_state if state is None else state
+        # Seconds a whole run may take (0 = no limit); papers not reached in time are left out
+        self.run_time_limit = run_time_limit
+        self.run_deadline: Optional[float] = None
+        self.cancel_token = CancelToken()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        self._pipeline: Optional[Pipeline] = None
+        # Placeholder holding the Cancel button while a run is in progress
+        self._cancel_button: Optional[Any] = None
+        # Characters streamed so far by the call running in each worker thread
+        self._received_chars: Dict[int, int] = {}
+        # PMIDs the last PubMed run fetched, and those it analyzed, pre-filtered or skipped as duplicates
+        self.fetched_pmids: Optional[Set[str]] = None
+        self.handled_pmids: Set[str] = set()
     
-    def analyze_pubmed_papers(self, query: str, max_results: int, action: str = "new") -> List[Dict[str, Any]]:
+    def _call_model(
+        self,
+        model: str,
+        content: Any,
+        is_pdf: bool,
+        metrics: PaperMetrics,
+        known_fields: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Send one paper to the configured provider (or its failover) and return the extracted fields"""
+        omit_fields = list(known_fields) if known_fields else None
+        provider, client, requested_model = self.provider, self.client, model
+        if self.fallback_client is not None and get_breaker(self.provider).is_open():
+            # Sustained 5xx/429 from the primary provider: use the other one until its circuit closes
+            provider, client, model = self.fallback_provider, self.fallback_client, self._fallback_model(model)
+            metrics.failover = True
+        model, system_prompt, max_tokens, fitted = self._prepare(provider, model, content, is_pdf, omit_fields, metrics)
+
+        def compute() -> Dict[str, Any]:
+            def primary(cancel_token: CancelToken) -> Dict[str, Any]:
+                return self._request(provider, client, model, fitted, is_pdf, metrics, omit_fields, max_tokens, cancel_token)
+
+            hedge, delay = None, None
+            # The duplicate runs in another thread, so it gets its own collector
+            hedge_metrics = PaperMetrics(metrics.paper_id, metrics.source)
+            if self.hedging:
+                delay = LATENCY.hedge_delay(provider, model)
+                if delay is not None:
+                    hedge = self._hedge(provider, client, model, content, fitted, is_pdf, hedge_metrics, omit_fields, max_tokens)
+            # Waiting for a hedge stops once its request deadline has certainly passed
+            deadline = request_deadline(self.run_deadline) + delay if delay is not None else None
+            result, winner, hedged = hedged_call(primary, hedge, delay, self.cancel_token, deadline)
+            if hedged:
+                metrics.add_hedge(hedge_metrics)
+                metrics.hedges += 1
+                metrics.hedge_wins += winner == "hedge"
+            return result
+
+        # Identical requests from any session are answered from, or wait for, the shared store
+        key = request_key(provider, model, system_prompt, fitted)
+        try:
+            result, source = RESULT_STORE.get_or_compute(key, compute, self.cancel_token.raise_if_cancelled)
+        except Exception as e:
+            if (
+                is_provider_failure(e)
+                and provider == self.provider
+                and self.fallback_client is not None
+                and get_breaker(self.provider).is_open()
+            ):
+                logger.warning(f"{self.provider} keeps failing ({e}); retrying {metrics.paper_id} on {self.fallback_provider}")
+                return self._call_model(requested_model, content, is_pdf, metrics, known_fields)
+            raise
+        if source != "miss":
+            metrics.cache_hit = True
+            metrics.shared_result = source
+        if known_fields:
+            result = self._merge_known_fields(result, known_fields, is_pdf, provider)
+        return result
+
+    def _prepare(
+        self,
+        provider: str,
+        model: str,
+        content: Any,
+        is_pdf: bool,
+        omit_fields: Optional[List[str]],
+        metrics: PaperMetrics
+    ) -> Tuple[str, str, int, Any]:
+        """Resolve the model and budget tokens locally, so oversized requests never reach the API"""
+        system_prompt = self._system_prompt(is_pdf, omit_fields, provider)
+        if model == AUTO_MODEL:
+            model = select_model(content, system_prompt, self._provider_models(provider))
+        max_tokens = output_budget(system_prompt, model)
+        content, reductions = fit_content(content, system_prompt, model, max_tokens)
+        if reductions:
+            logger.warning(f"Input for {metrics.paper_id} reduced to fit {model}: {', '.join(reductions)}")
+            metrics.input_reductions.extend(reduction for reduction in reductions if reduction not in metrics.input_reductions)
+        return model, system_prompt, max_tokens, content
+
+    def _request(
+        self,
+        provider: str,
+        client: Union["OpenAI", "Anthropic"],
+        model: str,
+        content: Any,
+        is_pdf: bool,
+        metrics: PaperMetrics,
+        omit_fields: Optional[List[str]],
+        max_tokens: int,
+        cancel_token: CancelToken,
+        wait_for_slot: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Make one LLM request, feeding the provider's circuit breaker and latency percentiles
+
+        An answer cut off at max_tokens is requested once more with the
+        model's full output limit before OutputTruncated is raised.
+        """
+        analyze = analyze_paper_with_openai if provider == "openai" else analyze_paper_with_claude
+
+        def call(content: Any, max_tokens: int) -> Dict[str, Any]:
+            return analyze(
+                client, 
+                content, 
+                is_pdf=is_pdf,
+                model=model,
+                metrics=metrics,
+                omit_fields=omit_fields,
+                max_tokens=max_tokens,
+                deadline=self.run_deadline,
+                cancel_token=cancel_token,
+                on_progress=self._on_progress
+            )
+
+        # Concurrency limits are shared with every other session of this server
+        with LIMITER.slot(provider, model, cancel_token.raise_if_cancelled, wait=wait_for_slot) as waited:
+            metrics.stages["llm_queue"] = metrics.stages.get("llm_queue", 0.0) + waited
+            start = time.perf_counter()
+            try:
+                try:
+                    result = call(content, max_tokens)
+                except OutputTruncated:
+                    output_limit = model_limits(model)[1]
+                    if max_tokens >= output_limit:
+                        raise
+                    logger.warning(f"Answer for {metrics.paper_id} truncated at {max_tokens} tokens; retrying with {output_limit}")
+                    # The larger answer may need a shorter input to stay within the context window
+                    content, reductions = fit_content(content, self._system_prompt(is_pdf, omit_fields, provider), model, output_limit)
+                    metrics.input_reductions.extend(reduction for reduction in reductions if reduction not in metrics.input_reductions)
+                    result = call(content, output_limit)
+            except Exception as e:
+                if is_provider_failure(e) and get_breaker(provider).record_failure():
+                    logger.warning(f"Circuit for {provider} opened after repeated 5xx/429 responses")
+                raise
+        get_breaker(provider).record_success()
+        LATENCY.record(provider, model, time.perf_counter() - start)
+        return result
+
+    def _hedge(
+        self,
+        provider: str,
+        client: Union["OpenAI", "Anthropic"],
+        model: str,
+        content: Any,
+        fitted: Any,
+        is_pdf: bool,
+        metrics: PaperMetrics,
+        omit_fields: Optional[List[str]],
+        max_tokens: int
+    ) -> Callable[[CancelToken], Dict[str, Any]]:
+        """Return the duplicate request for a slow call, sent where DEFAULT_CONFIG["hedging"]["target"] says"""
+        to_fallback = (
+            DEFAULT_CONFIG["hedging"]["target"] == "fallback"
+            and provider == self.provider
+            and self.fallback_client is not None
+            and not get_breaker(self.fallback_provider).is_open()
+        )
+
+        # Hedges never wait for a slot, so they cannot add to a backlog
+        def hedge(cancel_token: CancelToken) -> Dict[str, Any]:
+            if not to_fallback:
+                return self._request(provider, client, model, fitted, is_pdf, metrics, omit_fields, max_tokens,
+                                     cancel_token, wait_for_slot=False)
+            other_model, _, other_max_tokens, other_content = self._prepare(
+                self.fallback_provider, self._fallback_model(model), content, is_pdf, omit_fields, metrics
+            )
+            return self._request(self.fallback_provider, self.fallback_client, other_model, other_content, is_pdf,
+                                 metrics, omit_fields, other_max_tokens, cancel_token, wait_for_slot=False)
+
+        return hedge
+
+    def _fallback_model(self, model: str) -> str:
+        """Model of the failover provider standing in for one of the primary provider's models"""
+        if model == AUTO_MODEL:
+            return AUTO_MODEL
+        if model == self.triage_model:
+            return DEFAULT_CONFIG["cascade_models"][self.fallback_provider]
+        return DEFAULT_CONFIG["default_openai_model" if self.fallback_provider == "openai" else "default_claude_model"]
+
+    def _system_prompt(self, is_pdf: bool, omit_fields: Optional[List[str]] = None, provider: Optional[str] = None) -> str:
+        """System prompt the provider's analyze function sends"""
+        if (provider or self.provider) == "openai":
+            return get_openai_prompt(is_pdf, omit_fields)
+        return get_claude_prompt(is_pdf, omit_fields)
+
+    def _merge_known_fields(
+        self,
+        result: Dict[str, Any],
+        known_fields: Dict[str, Any],
+        is_pdf: bool,
+        provider: str
+    ) -> Dict[str, Any]:
+        """Override the model's answer with the known fields, keeping the columns in the prompt's field order"""
+        prompt_fields = re.findall(r"^\s*'([^']+)'", self._system_prompt(is_pdf, None, provider), re.MULTILINE)
+        merged = {}
+        for field in prompt_fields:
+            if field in known_fields:
+                merged[field] = known_fields[field]
+            elif field in result:
+                merged[field] = result[field]
+        # Anything the prompt does not list (extra model output, unlisted known fields) follows
+        merged.update((field, value) for field, value in result.items() if field not in merged and field not in known_fields)
+        merged.update((field, value) for field, value in known_fields.items() if field not in merged)
+        return merged
+
+    def _provider_models(self, provider: Optional[str] = None) -> List[str]:
+        """Concrete models of a provider (default: the configured one), for auto selection"""
+        models = DEFAULT_CONFIG["openai_models"] if (provider or self.provider) == "openai" else DEFAULT_CONFIG["claude_models"]
+        return [model for model in models if model != AUTO_MODEL]
+
+    def _analyze_content(
+        self,
+        content: Any,
+        is_pdf: bool,
+        metrics: PaperMetrics,
+        known_fields: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze one paper, going through the triage model first in cascade mode
+
+        Args:
+            content: PubMed record or extracted PDF text
+            is_pdf: Whether the content is from a PDF
+            metrics: Collector for this paper
+            known_fields: Result fields already known (e.g. from PubMed XML); the model is told not to generate them
+
+        Returns:
+            Analyzed paper data as dictionary
+        """
+        if not self.triage_model:
+            return self._call_model(self.model, content, is_pdf, metrics, known_fields)
+
+        if not fits(content, self._system_prompt(is_pdf, list(known_fields) if known_fields else None), self.triage_model):
+            # A truncated input would only fail the checks; go straight to the larger model
+            metrics.cascade = "skipped"
+            return self._call_model(self.model, content, is_pdf, metrics, known_fields)
+
+        try:
+            result = self._call_model(self.triage_model, content, is_pdf, metrics, known_fields)
+            failures = triage_failures(result)
+        except Exception as e:
+            if self._stop_reason():
+                raise
+            failures = [f"triage call failed: {e}"]
+
+        if not failures:
+            metrics.cascade = "accepted"
+            return result
+
+        logger.info(f"Escalating {metrics.paper_id} to {self.model}: {'; '.join(failures)}")
+        metrics.cascade = "escalated"
+        metrics.escalation_reasons = failures
+        return self._call_model(self.model, content, is_pdf, metrics, known_fields)
+
+    def _on_progress(self, received_chars: int) -> None:
+        # Called from worker threads; only the script thread touches the UI
+        self._received_chars[threading.get_ident()] = received_chars
+
+    def _stop_reason(self) -> Optional[str]:
+        """Return "cancelled" or "deadline" once the run has to stop, otherwise None"""
+        if self.cancel_token.cancelled:
+            return "cancelled"
+        if self.run_deadline is not None and time.monotonic() >= self.run_deadline:
+            return "deadline"
+        return None
+
+    def _begin_run(self) -> None:
+        """Arm cancellation and the run deadline, and show the Cancel button"""
+        self.cancel_token = CancelToken()
+        self.state['cancel_token'] = self.cancel_token
+        self.state['run_stop_reason'] = None
+        self.run_deadline = time.monotonic() + self.run_time_limit if self.run_time_limit else None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-call")
+        self._cancel_button = display_cancel_button()
+
+    def _run_call(self, label: str, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run an LLM call in the worker thread while the script thread keeps the page live
+
+        The page is updated every quarter second, which is also when Streamlit
+        can interrupt the script for a rerun (e.g. the Cancel button). If that
+        happens, _end_run() cancels the call still in flight.
+
+        Args:
+            label: Status text shown while waiting
+            func: Callable doing the LLM call(s)
+            args: Arguments for func
+
+        Returns:
+            The return value of func
+        """
+        status = st.empty()
+        self._received_chars.clear()
+        self._pending = self._executor.submit(func, *args)
+        try:
+            while True:
+                try:
+                    return self._pending.result(timeout=0.25)
+                except FutureTimeoutError:
+                    received = sum(self._received_chars.values())
+                    status.caption(f"{label}, {received:,} characters received" if received else label)
+        finally:
+            status.empty()
+
+    def _end_run(self, run_metrics: RunMetrics) -> None:
+        """Stop anything still in flight and store what the run produced; also runs when Streamlit interrupts the script"""
+        stop_reason = self._stop_reason()
+        pending = self._pending is not None and not self._pending.done()
+        if pending or (self._pipeline is not None and not self._pipeline.completed):
+            self.cancel_token.cancel()
+        if self._pipeline is not None:
+            run_metrics.pipeline = self._pipeline.stats()
+            self._pipeline.close()
+            self._pipeline = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._cancel_button is not None:
+            # A click after the run ended would mark the finished run as cancelled
+            self._cancel_button.empty()
+            self._cancel_button = None
+        self.state['cancel_token'] = None
+        self.state['run_stop_reason'] = stop_reason or self._stop_reason()
+        self.state['run_metrics'] = run_metrics.finish()
+        if self.state['analysis_results']:
+            # Results completed before a cancel or deadline are kept and shown
+            self.state['search_completed'] = True
+
+    def _finish_run(self, run_metrics: RunMetrics) -> None:
+        """Report duplicates and cascade results for the finished run"""
+        skipped = run_metrics.counters.get('duplicates_skipped', 0)
+        if skipped:
+            st.info(f"Skipped {skipped} duplicate paper(s) already in the results table ({skipped} LLM call(s) avoided).")
+        cascade = self.state['run_metrics']['cascade']
+        if cascade and cascade['triaged']:
+            st.info(
+                f"Cascade: {cascade['accepted']}/{cascade['triaged']} paper(s) accepted from {cascade['triage_model']}, "
+                f"{cascade['escalated']} escalated to {cascade['flagship_model']} "
+                f"({cascade['escalation_rate']:.0%} escalation rate)."
+            )
+        hedges = run_metrics.counters.get('hedges_fired', 0)
+        if hedges:
+            st.info(f"Hedging: {hedges} slow call(s) duplicated, {run_metrics.counters.get('hedges_won', 0)} answered first by the duplicate.")
+        failovers = run_metrics.counters.get('failovers', 0)
+        if failovers:
+            st.warning(f"{self.provider.capitalize()} kept failing; {failovers} paper(s) were analyzed with {self.fallback_provider.capitalize()} instead.")
+
+    def _report_reductions(self, name: str, paper_metrics: PaperMetrics) -> None:
+        """Tell the user when a paper was shortened to fit the model's context window"""
+        if paper_metrics.input_reductions:
+            model = paper_metrics.calls[-1]["model"] if paper_metrics.calls else self.model
+            st.warning(f"{name} was too long for {model} and was shortened ({', '.join(paper_metrics.input_reductions)}).")
+
+    def _record_failure(self, run_metrics: RunMetrics, paper_metrics: PaperMetrics, error: Exception) -> bool:
+        """Record a failed paper; returns True when the failure means the run has to stop"""
+        paper_metrics.error = str(error) or type(error).__name__
+        run_metrics.add(paper_metrics)
+        if isinstance(error, StreamStalled):
+            run_metrics.increment('stalled_requests')
+        if self._stop_reason():
+            run_metrics.increment('cancelled_requests' if self.cancel_token.cancelled else 'deadline_requests')
+            return True
+        return False
+
+    def _dedup_index(self, action: str) -> DedupIndex:
+        """Return the dedup index for the results a run will add to"""
+        if action == "new" or self.state.get('dedup_index') is None:
+            self.state['dedup_index'] = DedupIndex.from_results(self.state['analysis_results'])
+        return self.state['dedup_index']
+
+    def analyze_pubmed_papers(
+        self,
+        query: str,
+        max_results: int,
+        action: str = "new",
+        prefilter: Optional[Dict[str, Any]] = None,
+        pmids: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search PubMed and analyze papers
         
@@ -26,57 +463,204 @@ class AnalysisService:
             query: PubMed search query
             max_results: Maximum number of results
             action: "new" to start fresh or "append" to add to existing results
+            prefilter: Rules as in DEFAULT_CONFIG["pubmed_prefilter"]; None analyzes every record
+            pmids: Fetch and analyze exactly these PMIDs instead of running the query
             
         Returns:
             List of analyzed papers
         """
+        run_metrics = RunMetrics("pubmed", self.provider, self.model, self.triage_model)
+        self.fetched_pmids = None
+        self.handled_pmids = set()
         with st.spinner(f"Searching PubMed for '{query}'..."):
-            papers = search_and_fetch_pubmed(query, max_results)
+            with run_metrics.stage("search"):
+                papers = fetch_pubmed_records(pmids) if pmids is not None else search_and_fetch_pubmed(query, max_results)
             if 'PubmedArticle' in papers:
-                st.session_state['total_papers'] = len(papers['PubmedArticle'])
-                st.write(f"Found {st.session_state['total_papers']} papers.")
+                records = list(papers['PubmedArticle'])
+                self.fetched_pmids = {extract_record_metadata(paper)['pmid'] for paper in records}
+                st.write(f"Found {len(records)} papers.")
             else:
+                self.fetched_pmids = set()
                 st.error("No papers found. Try a different search query.")
-                st.session_state['total_papers'] = 0
+                self.state['total_papers'] = 0
                 return []
 
-        if st.session_state['total_papers'] > 0:
+        if prefilter:
+            with run_metrics.stage("prefilter"):
+                records, excluded = prefilter_records(records, prefilter)
+            if excluded:
+                run_metrics.increment('prefiltered', len(excluded))
+                self.handled_pmids.update(extract_record_metadata(paper)['pmid'] for paper, _ in excluded)
+                reasons = {}
+                for _, reason in excluded:
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                st.info(
+                    f"Pre-filter excluded {len(excluded)} record(s) before analysis: "
+                    + "; ".join(f"{reason} ({count})" for reason, count in reasons.items())
+                )
+        self.state['total_papers'] = len(records)
+
+        if self.state['total_papers'] > 0:
             progress_bar = st.progress(0)
             
             # Initialize or append to results based on action
             if action == "new":
-                st.session_state['analysis_results'] = []
+                self.state['analysis_results'] = []
+            # The PubMed query every row of the table came from; None once rows from elsewhere are mixed in
+            if action == "new" or not self.state['analysis_results'] or self.state.get('results_query') == query:
+                self.state['results_query'] = query
+            else:
+                self.state['results_query'] = None
+            dedup_index = self._dedup_index(action)
+            self._begin_run()
             
-            for i, paper in enumerate(papers['PubmedArticle']):
-                try:
-                    with st.spinner(f"Analyzing paper {i+1}/{st.session_state['total_papers']}..."):
-                        if self.provider == "openai":
-                            result = analyze_paper_with_openai(
-                                self.client, 
-                                paper, 
-                                is_pdf=False,
-                                model=self.model
-                            )
-                        else:  # anthropic
-                            result = analyze_paper_with_claude(
-                                self.client, 
-                                paper, 
-                                is_pdf=False,
-                                model=self.model
-                            )
-                        st.session_state['analysis_results'].append(result)
-                except Exception as e:
-                    st.error(f"Error analyzing paper {i+1}: {e}")
-                    logger.error(f"Error analyzing paper: {e}")
-
-                st.session_state['progress'] = (i + 1) / st.session_state['total_papers']
-                progress_bar.progress(st.session_state['progress'])
-
-            st.session_state['search_completed'] = True
-            return st.session_state['analysis_results']
+            try:
+                for i, paper in enumerate(records):
+                    if self._stop_reason():
+                        break
+                    pmid = str(paper.get('MedlineCitation', {}).get('PMID', i + 1))
+                    keys = record_keys(paper)
+                    if dedup_index.find(keys) is not None:
+                        # Already analyzed in this results table; skip the LLM call
+                        run_metrics.increment('duplicates_skipped')
+                        self.handled_pmids.add(pmid)
+                        self.state['progress'] = (i + 1) / self.state['total_papers']
+                        progress_bar.progress(self.state['progress'])
+                        continue
+
+                    paper_metrics = run_metrics.new_paper(pmid)
+                    try:
+                        # Bibliographic fields come from the XML, so the model does not generate them
+                        known_fields = deterministic_fields(extract_record_metadata(paper))
+                        result = self._run_call(
+                            f"Analyzing paper {i+1}/{self.state['total_papers']}...",
+                            self._analyze_content, paper, False, paper_metrics, known_fields
+                        )
+                        self.state['analysis_results'].append(result)
+                        dedup_index.add(keys | result_keys(result), len(self.state['analysis_results']) - 1)
+                        self.handled_pmids.add(pmid)
+                        run_metrics.add(paper_metrics)
+                        self._report_reductions(f"Paper {i+1}", paper_metrics)
+                    except Exception as e:
+                        if self._record_failure(run_metrics, paper_metrics, e):
+                            break
+                        st.error(f"Error analyzing paper {i+1}: {e}")
+                        logger.error(f"Error analyzing paper: {e}")
+
+                    self.state['progress'] = (i + 1) / self.state['total_papers']
+                    progress_bar.progress(self.state['progress'])
+            finally:
+                self._end_run(run_metrics)
+
+            self._finish_run(run_metrics)
+            self.state['search_completed'] = True
+            return self.state['analysis_results']
         
         return []
     
+    def refresh_saved_query(self, name: str, action: str = "new") -> List[Dict[str, Any]]:
+        """
+        Analyze only the papers added to PubMed since a saved query last ran
+
+        The query is searched with esearch date bounds from the last run date
+        (entry date, so records indexed late are not missed). PMIDs the saved
+        query already handled are dropped before efetch, and at most its
+        max_results new papers are analyzed per refresh; the rest stay pending
+        for the next one. New results are merged into the saved result set.
+
+        Args:
+            name: Name of the saved query
+            action: "new" to replace the results table with the saved result set plus the new papers,
+                "append" to add the new papers to the current table
+
+        Returns:
+            The merged result set
+        """
+        saved = load_saved_query(name)
+        if saved is None:
+            st.error(f"Saved query '{name}' not found.")
+            return []
+
+        today = time.strftime("%Y/%m/%d")
+        with st.spinner(f"Checking PubMed for new papers matching '{saved['name']}'..."):
+            if saved['last_run']:
+                found = search_pubmed_ids(saved['query'], ESEARCH_MAX_IDS, mindate=saved['last_run'], maxdate=today)
+            else:
+                found = search_pubmed_ids(saved['query'], saved['max_results'])
+        known = set(saved['known_pmids'])
+        new_pmids = [pmid for pmid in dict.fromkeys(saved['pending_pmids'] + found) if pmid not in known]
+        batch = new_pmids[:saved['max_results']]
+
+        if action == "new":
+            # The saved result set becomes the table the refresh adds to
+            self.state['analysis_results'] = list(saved['results'])
+            self.state['dedup_index'] = None
+            self.state['results_query'] = saved['query'] if saved['results'] else None
+        self.fetched_pmids = None
+        self.handled_pmids = set()
+        try:
+            if batch:
+                since = f" since {saved['last_run']}" if saved['last_run'] else ""
+                st.write(f"{len(new_pmids)} new paper(s){since}; analyzing {len(batch)}.")
+                self.analyze_pubmed_papers(saved['query'], len(batch), action="append", prefilter=saved['prefilter'], pmids=batch)
+            else:
+                st.success(f"No new papers since {saved['last_run']}.")
+                self.state['search_completed'] = True
+        finally:
+            # Also runs when the refresh is cancelled, so finished work is never paid for twice
+            handled = set(self.handled_pmids)
+            if self.fetched_pmids is not None:
+                # Deleted or withdrawn records are not returned by efetch; do not ask for them again
+                handled |= set(batch) - self.fetched_pmids
+            # Rows for the PMIDs this refresh handled: new analyses, and papers already in the table
+            saved_pmids = {str(result.get('PMID', '')) for result in saved['results']}
+            additions = [
+                result for result in self.state['analysis_results']
+                if str(result.get('PMID', '')) in handled and str(result.get('PMID', '')) not in saved_pmids
+            ]
+            saved['results'] = saved['results'] + additions
+            saved['known_pmids'] = sorted(known | handled)
+            saved['pending_pmids'] = [pmid for pmid in new_pmids if pmid not in handled]
+            saved['history'].append({
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "found": len(found),
+                "new": len(new_pmids),
+                "analyzed": len(additions),
+                "pending": len(saved['pending_pmids']),
+            })
+            saved['last_run'] = today
+            save_query(saved)
+
+        if saved['pending_pmids']:
+            st.info(f"{len(saved['pending_pmids'])} new paper(s) are still pending; refresh again to analyze them.")
+        return saved['results']
+
+    def _add_pdf_text(self, processed: Dict[str, Any]) -> None:
+        """Store a reference to a file's extracted text for the download section"""
+        self.state['pdf_texts'].append({
+            'filename': processed['filename'],
+            'text_key': processed['text_key'],
+            'chars': len(processed['content'])
+        })
+        self.state['pdf_analysis_completed'] = True
+
+    def _restore_upload_order(
+        self,
+        first_row: int,
+        row_files: List[int],
+        first_text: int,
+        text_files: List[int],
+        dedup_index: DedupIndex
+    ) -> None:
+        """Sort the rows and texts a PDF run appended (in completion order) by upload position"""
+        rows = self.state['analysis_results']
+        order = sorted(range(len(row_files)), key=lambda k: row_files[k])
+        rows[first_row:] = [rows[first_row + k] for k in order]
+        dedup_index.remap({first_row + old: first_row + new for new, old in enumerate(order)})
+        texts = self.state['pdf_texts']
+        order = sorted(range(len(text_files)), key=lambda k: text_files[k])
+        texts[first_text:] = [texts[first_text + k] for k in order]
+
     def analyze_pdf_files(
         self, 
         pdf_files: List[Any], 
@@ -96,53 +680,137 @@ class AnalysisService:
         Returns:
             List of analyzed papers
         """
-        st.session_state['total_papers'] = len(pdf_files)
+        run_metrics = RunMetrics("pdf", self.provider, self.model, self.triage_model)
+        self.state['total_papers'] = len(pdf_files)
         progress_bar = st.progress(0)
         
         # Initialize or append to results based on action
         if action == "new":
-            st.session_state['pdf_texts'] = []
-            st.session_state['analysis_results'] = []
+            self.state['pdf_texts'] = []
+            self.state['analysis_results'] = []
+        self.state['results_query'] = None
+        dedup_index = self._dedup_index(action)
+        # Files finish in any order; rows and texts added by this run are put back in upload order at the end
+        first_row, first_text = len(self.state['analysis_results']), len(self.state['pdf_texts'])
+        row_files: List[int] = []
+        text_files: List[int] = []
+
+        # Read the uploads up front; only names and bytes cross into the extraction processes
+        files = [(pdf_file.name, pdf_file.read()) for pdf_file in pdf_files]
+        papers = [run_metrics.new_paper(name) for name, _ in files]
+        # Set once a file's result has been handled, for duplicates waiting on it
+        settled = [threading.Event() for _ in files]
+        in_flight = DedupIndex()
+        dedup_lock = threading.Lock()
+
+        settings = DEFAULT_CONFIG["pdf_pipeline"]
+        extract_workers = settings["extract_workers"] or default_process_workers()
+        get_process_pool(extract_workers)
+
+        text_store = get_text_store()
+
+        def extract(i: int) -> Tuple[int, Dict[str, Any]]:
+            name, data = files[i]
+            processed = run_in_process(extract_file_worker, name, data, use_ocr, language)
+            for stage, seconds in processed.pop('stages').items():
+                papers[i].stages[stage] = papers[i].stages.get(stage, 0.0) + seconds
+            # The text goes to disk; the session only keeps its key
+            processed['text_key'] = text_store.put(processed['content'])
+            return i, processed
+
+        def analyze(item: Tuple[int, Dict[str, Any]]) -> Dict[str, Any]:
+            i, processed = item
+            # Skip the LLM call for a file (or a PubMed paper with its DOI) already in the table
+            keys = text_keys(processed['content'])
+            with dedup_lock:
+                owner = in_flight.find(keys)
+                if owner is None:
+                    in_flight.add(keys, i)
+            if owner is not None:
+                # The same paper is being analyzed right now; wait for that result instead of paying twice
+                while not settled[owner].wait(0.1):
+                    self.cancel_token.raise_if_cancelled()
+            with dedup_lock:
+                existing = dedup_index.find(keys)
+            result = None
+            if existing is None:
+                try:
+                    result = self._analyze_content(processed['content'], True, papers[i])
+                finally:
+                    self._received_chars.pop(threading.get_ident(), None)
+            return {"index": i, "processed": processed, "keys": keys, "existing": existing, "result": result}
+
+        self._begin_run()
+        self._pipeline = pipeline = Pipeline(settings["queue_size"])
+        pipeline.add_stage("extract", extract, extract_workers)
+        pipeline.add_stage("analyze", analyze, settings["analysis_workers"])
+        status = st.empty()
+        finished = 0
         
-        for i, pdf_file in enumerate(pdf_files):
-            try:
-                with st.spinner(f"Processing file {i+1}/{len(pdf_files)}: {pdf_file.name}"):
-                    # Process the file
-                    processed_file = process_file(pdf_file, use_ocr, language)
-                    
-                    # Store extracted text
-                    st.session_state['pdf_texts'].append({
-                        'filename': processed_file['filename'],
-                        'content': processed_file['content']
-                    })
-                    
-                    # Analyze the PDF content
-                    with st.spinner(f"Analyzing content of {pdf_file.name}..."):
-                        if self.provider == "openai":
-                            result = analyze_paper_with_openai(
-                                self.client, 
-                                processed_file['content'], 
-                                is_pdf=True,
-                                model=self.model
-                            )
-                        else:  # anthropic
-                            result = analyze_paper_with_claude(
-                                self.client, 
-                                processed_file['content'], 
-                                is_pdf=True,
-                                model=self.model
-                            )
-                        # Add filename to result
-                        result['Filename'] = pdf_file.name
-                        st.session_state['analysis_results'].append(result)
-            
-            except Exception as e:
-                st.error(f"Error processing {pdf_file.name}: {e}")
-                logger.error(f"Error processing PDF: {e}")
-            
-            st.session_state['progress'] = (i + 1) / len(pdf_files)
-            progress_bar.progress(st.session_state['progress'])
+        try:
+            pipeline.start(range(len(files)))
+            for output in pipeline.results(timeout=0.25):
+                if self._stop_reason():
+                    break
+                if output is None:
+                    # Keep the page live; this is also where Streamlit can interrupt the run
+                    busy = pipeline.in_progress()
+                    received = sum(self._received_chars.values())
+                    status.caption(
+                        f"Extracting {busy['extract']} and analyzing {busy['analyze']} file(s), "
+                        f"{finished}/{len(files)} done" + (f", {received:,} characters received" if received else "")
+                    )
+                    continue
+
+                if isinstance(output, PipelineError):
+                    # Extraction items are file indices; analysis items are (index, extracted file) pairs
+                    i = output.item if output.stage == "extract" else output.item[0]
+                else:
+                    i = output["index"]
+                name = files[i][0]
+                paper_metrics = papers[i]
+                finished += 1
+
+                if isinstance(output, PipelineError):
+                    if output.stage == "analyze":
+                        # The text was extracted and stored before the analysis failed; keep it downloadable
+                        self._add_pdf_text(output.item[1])
+                        text_files.append(i)
+                    settled[i].set()
+                    if self._record_failure(run_metrics, paper_metrics, output.error):
+                        break
+                    st.error(f"Error processing {name}: {output.error}")
+                    logger.error(f"Error processing PDF: {output.error}")
+                else:
+                    self._add_pdf_text(output["processed"])
+                    text_files.append(i)
+
+                    with dedup_lock:
+                        existing = output["existing"]
+                        if existing is not None:
+                            self.state['analysis_results'][existing].setdefault('Filename', name)
+                            dedup_index.add(output["keys"], existing)
+                            run_metrics.increment('duplicates_skipped')
+                        else:
+                            result = output["result"]
+                            # Add filename to result
+                            result['Filename'] = name
+                            self.state['analysis_results'].append(result)
+                            row_files.append(i)
+                            dedup_index.add(output["keys"] | result_keys(result), len(self.state['analysis_results']) - 1)
+                    settled[i].set()
+                    run_metrics.add(paper_metrics)
+                    self._report_reductions(name, paper_metrics)
+                
+                self.state['progress'] = finished / len(files)
+                progress_bar.progress(self.state['progress'])
+        finally:
+            status.empty()
+            with dedup_lock:
+                self._restore_upload_order(first_row, row_files, first_text, text_files, dedup_index)
+            self._end_run(run_metrics)
         
-        st.session_state['pdf_analysis_completed'] = True
-        st.session_state['search_completed'] = True
-        return st.session_state['analysis_results']
+        self._finish_run(run_metrics)
+        self.state['pdf_analysis_completed'] = True
+        self.state['search_completed'] = True
+        return self.state['analysis_results']
@@ -1,27 +1,31 @@
 import streamlit as st
-import pandas as pd
-import io
-import time
-import os
 import logging
-from datetime import datetime
 
 # Import from our modules
 from config import DEFAULT_CONFIG, get_secrets
-from utils.api_utils import setup_api_key_ui
+from utils.api_utils import setup_api_key_ui, get_client, validate_api_key
 from utils.ui_utils import (
     initialize_session_state, 
     display_confirmation_dialog,
     display_new_search_dialog,
     display_results_table_and_download,
-    display_pdf_text_downloads
+    display_pdf_text_downloads,
+    display_run_metrics,
+    display_run_stopped_warning
 )
+from utils.saved_query_utils import list_saved_queries, saved_query_from_results, save_query, delete_saved_query
 from services.analysis_service import AnalysisService
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@st.cache_resource(show_spinner=False)
+def start_metrics_endpoint(port: int):
+    # Started once per process; shared by all sessions
+    from utils.metrics_utils import start_metrics_server
+    return start_metrics_server(port)
+
 # Initialize app
 def init_app():
     # Configure page
@@ -41,6 +45,10 @@ def init_app():
         from utils.pubmed_utils import configure_entrez
         configure_entrez(secrets["ncbi_email"], secrets["ncbi_api_key"])
 
+    # Prometheus-style /metrics endpoint, if enabled
+    if DEFAULT_CONFIG["metrics_port"]:
+        start_metrics_endpoint(DEFAULT_CONFIG["metrics_port"])
+
 # Main app function
 def main():
     init_app()
@@ -76,6 +84,47 @@ def main():
             )
             st.session_state[model_key] = selected_model
 
+            # Cascade mode: cheap triage model first, escalate only incomplete extractions
+            triage_model = DEFAULT_CONFIG["cascade_models"][st.session_state['api_provider']]
+            st.session_state['cascade_mode'] = st.checkbox(
+                "Cascade mode",
+                value=st.session_state.get('cascade_mode', False),
+                disabled=selected_model in (triage_model, "auto"),
+                help=f"Extract with {model_options[triage_model]} first and re-run only papers that fail "
+                     f"completeness checks with {model_options[selected_model]}."
+            )
+
+            # Papers not reached before the limit are left out; completed results are kept
+            st.session_state['run_time_limit'] = st.number_input(
+                "Run time limit (minutes, 0 = none)",
+                min_value=0,
+                max_value=24 * 60,
+                value=st.session_state.get('run_time_limit', 0),
+                step=5
+            )
+
+            # Duplicate requests that run far longer than usual; the first answer wins
+            st.session_state['hedging'] = st.checkbox(
+                "Hedge slow requests",
+                value=st.session_state.get('hedging', False),
+                help=f"Send a second request when a call takes longer than "
+                     f"{DEFAULT_CONFIG['hedging']['percentile']}% of recent calls, and use whichever answers first."
+            )
+
+            # Optional key for the other provider: failover on sustained 5xx/429, and a target for hedges
+            fallback_provider = "anthropic" if st.session_state['api_provider'] == 'openai' else "openai"
+            fallback_key = st.text_input(
+                f"Failover {'OpenAI' if fallback_provider == 'openai' else 'Anthropic'} API Key (optional)",
+                type="password"
+            )
+            st.session_state['fallback_api_key'] = None
+            if fallback_key:
+                is_valid, error = validate_api_key(fallback_provider, fallback_key)
+                if is_valid:
+                    st.session_state['fallback_api_key'] = fallback_key
+                else:
+                    st.error(f"Failover API Key Invalid: {error}")
+
     # Add a clear table button in the sidebar
     st.sidebar.markdown("---")
     if st.sidebar.button("Clear Results Table"):
@@ -91,19 +140,26 @@ def main():
     # Create client if API key is valid
     client = None
     if st.session_state.get('api_key_valid', False):
+        # Shared per-key client, so reruns reuse the same connection pool
+        client = get_client(st.session_state['api_provider'], st.session_state['api_key'])
         if st.session_state['api_provider'] == 'openai':
-            from utils.openai_utils import create_openai_client
-            client = create_openai_client(st.session_state['api_key'])
             model = st.session_state.get('openai_model', DEFAULT_CONFIG["default_openai_model"])
         else:  # anthropic
-            from utils.claude_utils import create_claude_client
-            client = create_claude_client(st.session_state['api_key'])
             model = st.session_state.get('claude_model', DEFAULT_CONFIG["default_claude_model"])
         
+        fallback_client = None
+        if st.session_state.get('fallback_api_key'):
+            fallback_provider = "anthropic" if st.session_state['api_provider'] == 'openai' else "openai"
+            fallback_client = get_client(fallback_provider, st.session_state['fallback_api_key'])
+        
         analysis_service = AnalysisService(
             client, 
             st.session_state['api_provider'],
-            model
+            model,
+            cascade=st.session_state.get('cascade_mode', False),
+            run_time_limit=st.session_state.get('run_time_limit', 0) * 60,
+            fallback_client=fallback_client,
+            hedging=st.session_state.get('hedging', False)
         )
     
     # Main UI based on selected tab
@@ -120,6 +176,39 @@ def main():
             step=1
         )
         
+        # Rule-based pre-filter applied to the fetched records before any LLM call
+        prefilter_defaults = DEFAULT_CONFIG["pubmed_prefilter"]
+        pubmed_language_names = {code: name for name, code in DEFAULT_CONFIG["pubmed_languages"].items()}
+        with st.expander("Pre-filter records before analysis"):
+            use_prefilter = st.checkbox("Enable pre-filter", value=True)
+            publication_type_options = sorted(set(prefilter_defaults["exclude_publication_types"]) | {
+                "Case Reports", "Clinical Trial", "Clinical Trial Protocol", "Meta-Analysis",
+                "Observational Study", "Randomized Controlled Trial", "Review", "Systematic Review",
+            })
+            prefilter = {
+                "require_abstract": st.checkbox("Require an abstract", value=prefilter_defaults["require_abstract"]),
+                "exclude_publication_types": st.multiselect(
+                    "Exclude publication types",
+                    publication_type_options,
+                    default=prefilter_defaults["exclude_publication_types"]
+                ),
+                "include_publication_types": st.multiselect(
+                    "Only these publication types (empty allows any)",
+                    publication_type_options,
+                    default=prefilter_defaults["include_publication_types"]
+                ),
+                "exclude_non_human": st.checkbox(
+                    "Exclude non-human studies (MeSH 'Animals' without 'Humans')",
+                    value=prefilter_defaults["exclude_non_human"]
+                ),
+                "languages": st.multiselect(
+                    "Languages (empty allows any)",
+                    list(DEFAULT_CONFIG["pubmed_languages"].values()),
+                    default=prefilter_defaults["languages"],
+                    format_func=lambda code: pubmed_language_names.get(code, code)
+                ),
+            } if use_prefilter else None
+
         # Store the query for file naming
         if query:
             st.session_state['last_query'] = query
@@ -132,13 +221,68 @@ def main():
                 
                 # Define callback for the dialog
                 def pubmed_callback(action):
-                    analysis_service.analyze_pubmed_papers(query, max_results, action=action)
+                    analysis_service.analyze_pubmed_papers(query, max_results, action=action, prefilter=prefilter)
                 
                 # Store callback
                 st.session_state['dialog_callback'] = pubmed_callback
             else:
                 # No existing results, proceed with new search
-                analysis_service.analyze_pubmed_papers(query, max_results, action="new")
+                analysis_service.analyze_pubmed_papers(query, max_results, action="new", prefilter=prefilter)
+
+        # Saved queries: re-run regularly, analyzing only papers added since the last run
+        refresh_name = None
+        with st.expander("Saved queries"):
+            save_name = st.text_input("Save this query and the current results as")
+            # The results seed the saved query's known PMIDs, so they must all come from this query
+            results_match = (
+                st.session_state.get('search_completed', False)
+                and st.session_state.get('results_query') == query
+            )
+            if not results_match and st.session_state.get('analysis_results'):
+                st.caption("Run this query first: only a results table from a PubMed search for it can be saved with it.")
+            if st.button("Save Query", disabled=not save_name or not results_match):
+                try:
+                    save_query(saved_query_from_results(
+                        save_name, query, max_results, prefilter, st.session_state['analysis_results']
+                    ))
+                    st.success(f"Saved '{save_name}'. Refreshing it will analyze only papers added from today on.")
+                except ValueError as e:
+                    st.error(str(e))
+
+            saved_queries = list_saved_queries()
+            if saved_queries:
+                names = [saved['name'] for saved in saved_queries]
+                selected = st.selectbox("Saved query", names)
+                chosen = saved_queries[names.index(selected)]
+                st.caption(
+                    f"{chosen['query']} · last run {chosen['last_run'] or 'never'} · "
+                    f"{len(chosen['results'])} results · {len(chosen['known_pmids'])} known PMIDs · "
+                    f"{len(chosen['pending_pmids'])} pending"
+                )
+                col1, col2, col3 = st.columns(3)
+                if col1.button("Refresh (new papers only)", disabled=start_analysis_disabled):
+                    refresh_name = selected
+                if col2.button("Load Saved Results"):
+                    st.session_state['analysis_results'] = list(chosen['results'])
+                    st.session_state['results_query'] = chosen['query']
+                    st.session_state['dedup_index'] = None
+                    st.session_state['run_metrics'] = None
+                    st.session_state['search_completed'] = True
+                if col3.button("Delete Saved Query"):
+                    delete_saved_query(selected)
+                    st.rerun()
+
+        if refresh_name:
+            if st.session_state.get('analysis_results'):
+                # Same choice as any other run: replace the current table or add to it
+                st.session_state['show_new_search_dialog'] = True
+
+                def refresh_callback(action):
+                    analysis_service.refresh_saved_query(refresh_name, action=action)
+
+                st.session_state['dialog_callback'] = refresh_callback
+            else:
+                analysis_service.refresh_saved_query(refresh_name, action="new")
 
     elif tab_selection == "PDF Upload":
         st.title("Clinical Trial PDF Analysis")
@@ -189,9 +333,17 @@ def main():
     if st.session_state.get('show_new_search_dialog', False) and 'dialog_callback' in st.session_state:
         display_new_search_dialog(tab_selection, st.session_state['dialog_callback'])
 
+    # Explain a cancelled or timed-out run
+    run_metrics = st.session_state.get('run_metrics')
+    display_run_stopped_warning(
+        st.session_state.get('run_stop_reason'),
+        run_metrics['completed'] if run_metrics else 0
+    )
+
     # Display Results and Download Button (common for both tabs)
     if st.session_state.get('search_completed', False):
         display_results_table_and_download(st.session_state.get('analysis_results', []), tab_selection)
+        display_run_metrics(st.session_state.get('run_metrics'))
         
         # If PDF analysis was done, offer text download
         if tab_selection == "PDF Upload" and st.session_state.get('pdf_analysis_completed', False):
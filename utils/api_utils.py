@@ -1,45 +1,121 @@
 # authenticates API key
-import requests
-from typing import Tuple, Optional
+import hashlib
+import importlib
+from typing import Tuple, Optional, Any
 import streamlit as st
-import openai
-from anthropic import Anthropic
+from config import DEFAULT_CONFIG
+from utils.streaming_utils import sdk_httpx
 
-def validate_openai_api_key(api_key: str) -> Tuple[bool, Optional[str]]:
+def hash_api_key(api_key: str) -> str:
+    """Return a stable hash of an API key, used as a cache key instead of the key itself"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def create_http_client(provider: str) -> Any:
     """
-    Validates the OpenAI API key by making a test request.
-    
+    Create the provider SDK's HTTP client with the connection pool limits from DEFAULT_CONFIG
+
+    Built with the SDK's DefaultHttpxClient, so it comes from the httpx
+    package that SDK version accepts (a plain httpx.Client is rejected by
+    SDKs built on httpx2).
+    """
+    sdk = importlib.import_module("openai" if provider == "openai" else "anthropic")
+    httpx = sdk_httpx(provider)
+    pool = DEFAULT_CONFIG["http_pool"]
+    return sdk.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=pool["max_connections"],
+            max_keepalive_connections=pool["max_keepalive_connections"],
+            keepalive_expiry=pool["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(600.0, connect=pool["connect_timeout"]),
+    )
+
+def _create_client(provider: str, api_key: str, http_client: Any) -> Any:
+    if provider == "openai":
+        from utils.openai_utils import create_openai_client
+        return create_openai_client(api_key, http_client=http_client)
+    from utils.claude_utils import create_claude_client
+    return create_claude_client(api_key, http_client=http_client)
+
+@st.cache_resource(
+    show_spinner=False,
+    max_entries=DEFAULT_CONFIG["api_client_cache"]["max_entries"],
+    ttl=DEFAULT_CONFIG["api_client_cache"]["ttl"]
+)
+def _get_cached_client(provider: str, key_hash: str, _api_key: str) -> Any:
+    # _api_key is excluded from Streamlit's cache hashing; key_hash identifies the entry
+    return _create_client(provider, _api_key, create_http_client(provider))
+
+def get_client(provider: str, api_key: str) -> Any:
+    """
+    Return the process-wide client for a provider and API key.
+
+    Clients are created once per key and shared across reruns and sessions,
+    so their HTTP connection pool (and TLS sessions) are reused. Call it
+    only for keys that passed validate_api_key(); validation itself uses a
+    temporary client, so invalid keys never reach the cache.
+
+    Args:
+        provider: "openai" or "anthropic"
+        api_key: The API key for the provider
+
+    Returns:
+        OpenAI or Anthropic client
+    """
+    return _get_cached_client(provider.lower(), hash_api_key(api_key), api_key)
+
+@st.cache_data(ttl=DEFAULT_CONFIG["api_key_validation_ttl"], show_spinner=False)
+def _check_api_key(provider: str, key_hash: str, _api_key: str) -> bool:
+    # Raises on failure so that only successful validations are cached.
+    # A throwaway client keeps mistyped keys from leaving a connection pool in the client cache.
+    http_client = create_http_client(provider)
+    try:
+        _create_client(provider, _api_key, http_client).models.list()
+    finally:
+        http_client.close()
+    return True
+
+def validate_api_key(provider: str, api_key: str) -> Tuple[bool, Optional[str]]:
+    """
+    Validates an API key by making a test request, caching successes for
+    DEFAULT_CONFIG["api_key_validation_ttl"] seconds.
+
     Args:
+        provider: "openai" or "anthropic"
         api_key: The API key to validate
-        
+
     Returns:
         Tuple of (is_valid, error_message)
     """
     try:
-        client = openai.OpenAI(api_key=api_key)
-        # Make a simple request to validate the key
-        models = client.models.list()
+        _check_api_key(provider.lower(), hash_api_key(api_key), api_key)
         return True, None
     except Exception as e:
         return False, str(e)
 
+def validate_openai_api_key(api_key: str) -> Tuple[bool, Optional[str]]:
+    """
+    Validates the OpenAI API key by making a test request.
+
+    Args:
+        api_key: The API key to validate
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    return validate_api_key("openai", api_key)
+
 def validate_anthropic_api_key(api_key: str) -> Tuple[bool, Optional[str]]:
     """
     Validates the Anthropic API key by making a test request.
-    
+
     Args:
         api_key: The API key to validate
-        
+
     Returns:
         Tuple of (is_valid, error_message)
     """
-    try:
-        client = Anthropic(api_key=api_key)
-        # Make a simple request to validate the key
-        models = client.models.list()
-        return True, None
-    except Exception as e:
-        return False, str(e)
+    return validate_api_key("anthropic", api_key)
 
 def setup_api_key_ui():
     """Sets up the API key input UI in the sidebar and handles validation"""
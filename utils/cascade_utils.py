@@ -0,0 +1,54 @@
+# confidence checks deciding whether a triage extraction needs the larger model
+from typing import List, Any
+
+# Fields every usable extraction must fill in
+REQUIRED_FIELDS = ['Title', 'Subject of Study', 'Type of Study', 'Results Available']
+
+BLANK_VALUES = {"", "na", "n/a", "none", "null", "not available", "not reported", "unknown", "not specified"}
+
+def is_blank(value: Any) -> bool:
+    """True for missing, empty or placeholder values such as 'NA'"""
+    if value is None:
+        return True
+    if isinstance(value, (list, dict)):
+        return len(value) == 0
+    return str(value).strip().lower() in BLANK_VALUES
+
+def _is_yes(value: Any) -> bool:
+    return str(value or "").strip().lower().startswith("y")
+
+def triage_failures(result: Any) -> List[str]:
+    """
+    Check a triage-model extraction for signs that it is incomplete or unreliable
+
+    Non-human studies and papers without results pass with few fields filled
+    in; human studies need a primary endpoint, and papers with results need
+    the primary endpoint result and outcome.
+
+    Args:
+        result: Parsed extraction returned by the triage model
+
+    Returns:
+        List of failed checks; empty if the result can be accepted as is
+    """
+    if not isinstance(result, dict):
+        return ["result is not a JSON object"]
+
+    failures = [f"missing '{field}'" for field in REQUIRED_FIELDS if is_blank(result.get(field))]
+    if not is_blank(result.get('Error')):
+        failures.append("model reported an error")
+
+    human = str(result.get('Subject of Study', '')).strip().lower().startswith("human")
+    if human:
+        if is_blank(result.get('Primary Endpoint')):
+            failures.append("missing 'Primary Endpoint'")
+        subjects = result.get('Number of Subjects Studied')
+        if not is_blank(subjects) and not str(subjects).replace(",", "").strip().isdigit():
+            failures.append("'Number of Subjects Studied' is not an integer")
+
+    if _is_yes(result.get('Results Available')):
+        for field in ('Primary Endpoint Result', 'Primary Endpoint Met'):
+            if is_blank(result.get(field)):
+                failures.append(f"'Results Available' is Yes but '{field}' is empty")
+
+    return failures
@@ -1,17 +1,22 @@
 # claude connection with prompts
 import json
-from anthropic import Anthropic
-from typing import Dict, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, TYPE_CHECKING
 import logging
+from utils.metrics_utils import PaperMetrics
+from utils.streaming_utils import CancelToken, OutputTruncated, RequestCancelled, consume_stream, request_deadline, request_timeout
+
+if TYPE_CHECKING:
+    from anthropic import Anthropic
 
 logger = logging.getLogger(__name__)
 
-def create_claude_client(api_key: str) -> Anthropic:
-    """Create and return an Anthropic client"""
-    return Anthropic(api_key=api_key)
+def create_claude_client(api_key: str, http_client: Optional[Any] = None) -> "Anthropic":
+    """Create and return an Anthropic client, optionally on a shared httpx client"""
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key, http_client=http_client)
 
-def get_analysis_prompt(is_pdf: bool = False) -> str:
-    """Get the system prompt for paper analysis"""
+def get_analysis_prompt(is_pdf: bool = False, omit_fields: Optional[List[str]] = None) -> str:
+    """Get the system prompt for paper analysis, leaving out fields filled in elsewhere"""
     system_prompt = """
     You are a bot speaking with another program that takes JSON formatted text as an input. Only return results in JSON format, with NO PREAMBLE.
     The user will input the results from a PubMed search or a full-text clinical trial PDF. Your job is to extract the exact information to return:
@@ -43,6 +48,15 @@ def get_analysis_prompt(is_pdf: bool = False) -> str:
       'Error': Error description, if any. Otherwise, leave emtpy
     """
 
+    if omit_fields:
+        system_prompt = "\n".join(
+            line for line in system_prompt.split("\n")
+            if not any(line.strip().startswith(f"'{field}'") for field in omit_fields)
+        )
+        system_prompt += f"""
+    Do not return these fields, they are filled in from PubMed metadata: {', '.join(omit_fields)}
+    """
+
     if is_pdf:
         system_prompt += """
         Note: This is a full-text PDF of a clinical trial. Extract as much detail as possible from the full text.
@@ -51,10 +65,16 @@ def get_analysis_prompt(is_pdf: bool = False) -> str:
     return system_prompt
 
 def analyze_paper_with_claude(
-    client: Anthropic, 
+    client: "Anthropic", 
     paper_content: Any, 
     is_pdf: bool = False, 
-    model: str = "claude-3-opus-20240229"
+    model: str = "claude-3-opus-20240229",
+    metrics: Optional[PaperMetrics] = None,
+    omit_fields: Optional[List[str]] = None,
+    max_tokens: int = 4096,
+    deadline: Optional[float] = None,
+    cancel_token: Optional[CancelToken] = None,
+    on_progress: Optional[Callable[[int], None]] = None
 ) -> Dict[str, Any]:
     """
     Analyze a paper using Claude
@@ -64,27 +84,75 @@ def analyze_paper_with_claude(
         paper_content: Content to analyze
         is_pdf: Whether the content is from a PDF
         model: Claude model to use
+        metrics: Collector for timings and token usage, if any
+        omit_fields: Result fields the model should not generate
+        max_tokens: Maximum tokens in the answer
+        deadline: time.monotonic() value the run must finish by; each request also has its own timeout
+        cancel_token: Token that aborts the request when cancelled
+        on_progress: Called with the number of characters streamed so far
         
     Returns:
         Analyzed paper data as dictionary
     """
+    metrics = metrics or PaperMetrics()
     try:
-        system_prompt = get_analysis_prompt(is_pdf)
+        system_prompt = get_analysis_prompt(is_pdf, omit_fields)
         
-        message = client.messages.create(
-            model=model,
-            system=system_prompt,
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "user",
-                    "content": str(paper_content)
-                }
-            ]
+        parts = []
+        usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0}
+        stop_reason = {}
+
+        def handle_event(event: Any) -> int:
+            if event.type == "message_start":
+                usage["input_tokens"] = event.message.usage.input_tokens
+                usage["cache_read_input_tokens"] = getattr(event.message.usage, "cache_read_input_tokens", 0) or 0
+            elif event.type == "message_delta":
+                usage["output_tokens"] = event.usage.output_tokens
+                if getattr(event.delta, "stop_reason", None):
+                    stop_reason["reason"] = event.delta.stop_reason
+            elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                parts.append(event.delta.text)
+                return len(event.delta.text)
+            return 0
+
+        with metrics.stage("llm") as timing:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            deadline = request_deadline(deadline)
+            raw_response = client.messages.with_raw_response.create(
+                model=model,
+                system=system_prompt,
+                max_tokens=max_tokens,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": str(paper_content)
+                    }
+                ],
+                stream=True,
+                timeout=request_timeout("anthropic", deadline)
+            )
+            consume_stream("anthropic", raw_response.parse(), handle_event, deadline, cancel_token, on_progress)
+
+        metrics.record_usage(
+            model,
+            usage["input_tokens"],
+            usage["output_tokens"],
+            retries=getattr(raw_response, "retries_taken", 0),
+            cached_input_tokens=usage["cache_read_input_tokens"],
+            seconds=timing["seconds"],
+            provider="anthropic"
         )
 
-        cleaned_str = message.content[0].text.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned_str)
+        if stop_reason.get("reason") == "max_tokens":
+            raise OutputTruncated(model, max_tokens)
+
+        with metrics.stage("parse"):
+            cleaned_str = "".join(parts).replace("```json", "").replace("```", "").strip()
+            return json.loads(cleaned_str)
+    except (OutputTruncated, RequestCancelled):
+        # Handled by the caller; a cancelled request is the loser of a hedge or a stopped run, not an error
+        raise
     except Exception as e:
         logger.error(f"Error analyzing paper with Claude: {e}")
         raise
@@ -0,0 +1,97 @@
+# duplicate detection by PMID, DOI, normalized title and text hash
+import hashlib
+import re
+import unicodedata
+from typing import Dict, List, Any, Optional, Set
+from utils.pubmed_utils import extract_record_metadata
+
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)", re.IGNORECASE)
+
+# Only the start of a PDF is searched for its DOI; later DOIs usually belong to references
+PDF_DOI_SEARCH_CHARS = 3000
+
+def normalize_doi(value: Any) -> Optional[str]:
+    """Extract a DOI from a string or URL and normalize it, or None"""
+    match = DOI_PATTERN.search(str(value or ""))
+    if not match:
+        return None
+    return match.group(1).rstrip(".,;)]").lower()
+
+def title_fingerprint(title: Any) -> Optional[str]:
+    """
+    Normalize a title for matching: accents, case, punctuation and spacing are ignored
+
+    Args:
+        title: Article title
+
+    Returns:
+        Fingerprint string, or None for titles too short to match reliably
+    """
+    text = unicodedata.normalize("NFKD", str(title or "")).encode("ascii", "ignore").decode("ascii")
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) < 4:
+        return None
+    return " ".join(words)
+
+def _keys(pmid: Any = None, doi: Any = None, title: Any = None) -> Set[str]:
+    keys = set()
+    pmid = str(pmid or "").strip()
+    if pmid.isdigit():
+        keys.add(f"pmid:{pmid}")
+    doi = normalize_doi(doi)
+    if doi:
+        keys.add(f"doi:{doi}")
+    fingerprint = title_fingerprint(title)
+    if fingerprint:
+        keys.add(f"title:{fingerprint}")
+    return keys
+
+def record_keys(paper: Dict[str, Any]) -> Set[str]:
+    """Dedup keys for a PubMed efetch record"""
+    metadata = extract_record_metadata(paper)
+    return _keys(metadata['pmid'], metadata['doi'], metadata['title'])
+
+def result_keys(result: Dict[str, Any]) -> Set[str]:
+    """Dedup keys for an analysis result row"""
+    return _keys(result.get('PMID'), result.get('Full Text Link'), result.get('Title'))
+
+def text_keys(text: str) -> Set[str]:
+    """Dedup keys for extracted PDF text: a content hash plus the DOI near the start"""
+    normalized = " ".join(text.split())
+    keys = {"sha:" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()}
+    doi = normalize_doi(text[:PDF_DOI_SEARCH_CHARS])
+    if doi:
+        keys.add(f"doi:{doi}")
+    return keys
+
+class DedupIndex:
+    """Maps dedup keys to the position of the matching row in the results list"""
+
+    def __init__(self):
+        self._positions: Dict[str, int] = {}
+
+    @classmethod
+    def from_results(cls, results: List[Dict[str, Any]]) -> "DedupIndex":
+        index = cls()
+        for position, result in enumerate(results):
+            index.add(result_keys(result), position)
+        return index
+
+    def find(self, keys: Set[str]) -> Optional[int]:
+        """Return the results position of the first matching key, or None"""
+        for key in sorted(keys):
+            if key in self._positions:
+                return self._positions[key]
+        return None
+
+    def add(self, keys: Set[str], position: int) -> None:
+        for key in keys:
+            self._positions.setdefault(key, position)
+
+    def remap(self, moved: Dict[int, int]) -> None:
+        """Update positions after rows were reordered; `moved` maps old positions to new ones"""
+        for key, position in self._positions.items():
+            self._positions[key] = moved.get(position, position)
+
+    def __len__(self) -> int:
+        return len(self._positions)
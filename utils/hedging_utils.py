@@ -0,0 +1,197 @@
+# hedged LLM requests, call latency percentiles and provider circuit breakers
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Callable, Deque, Optional, Tuple
+import logging
+from config import DEFAULT_CONFIG
+from utils.metrics_utils import percentile
+from utils.shared_store_utils import SlotUnavailable
+from utils.streaming_utils import CancelToken
+
+logger = logging.getLogger(__name__)
+
+def is_provider_failure(error: BaseException) -> bool:
+    """True for rate limiting and server errors (an openai/anthropic APIStatusError with status 429 or 5xx)"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+class LatencyTracker:
+    """Latencies of recent successful calls per provider and model, shared by all sessions"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, provider: str, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault((provider, model), deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, provider: str, model: str) -> Optional[float]:
+        """
+        Seconds after which a call to this model gets a hedge, per DEFAULT_CONFIG["hedging"]
+
+        Args:
+            provider: "openai" or "anthropic"
+            model: Model name
+
+        Returns:
+            The configured latency percentile of recent calls (at least min_delay),
+            or None while there are too few calls to tell what is slow
+        """
+        settings = DEFAULT_CONFIG["hedging"]
+        with self._lock:
+            samples = list(self._samples.get((provider, model), ()))
+        if len(samples) < settings["min_samples"]:
+            return None
+        return max(settings["min_delay"], percentile(samples, settings["percentile"]))
+
+class CircuitBreaker:
+    """
+    Tracks 5xx/429 failures of one provider
+
+    The circuit opens after `failures` failed calls within `window` seconds
+    and closes again `cooldown` seconds later; while it is open, calls go to
+    the other provider if a failover key is set.
+    """
+
+    def __init__(self, failures: int, window: float, cooldown: float):
+        self.failures = failures
+        self.window = window
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failed_at: Deque[float] = deque()
+        self._opened_at: Optional[float] = None
+
+    def record_failure(self) -> bool:
+        """Record a failed call; returns True if this failure opened the circuit"""
+        now = time.monotonic()
+        with self._lock:
+            self._failed_at.append(now)
+            while self._failed_at and now - self._failed_at[0] > self.window:
+                self._failed_at.popleft()
+            if self._opened_at is None and len(self._failed_at) >= self.failures:
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failed_at.clear()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return True
+            # Cooldown over: try the provider again with a clean slate
+            self._opened_at = None
+            self._failed_at.clear()
+            return False
+
+_breakers_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a provider"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            settings = DEFAULT_CONFIG["failover"]
+            _breakers[provider] = CircuitBreaker(settings["failures"], settings["window"], settings["cooldown"])
+        return _breakers[provider]
+
+LATENCY = LatencyTracker(DEFAULT_CONFIG["hedging"]["window"])
+
+def hedged_call(
+    primary: Callable[[CancelToken], Any],
+    hedge: Optional[Callable[[CancelToken], Any]],
+    delay: Optional[float],
+    cancel_token: CancelToken,
+    deadline: Optional[float] = None
+) -> Tuple[Any, str, bool]:
+    """
+    Run `primary`, and also `hedge` if primary has not finished after `delay` seconds
+
+    Each attempt gets its own child of `cancel_token`. The first attempt to
+    succeed wins and the other one is cancelled; if one attempt fails, the
+    other one's answer is used. The primary runs in the calling thread and
+    the hedge in a timer thread.
+
+    Args:
+        primary: Makes the request; called with the token that aborts it
+        hedge: Makes the duplicate request, or None to not hedge
+        delay: Seconds to wait before hedging, or None to not hedge
+        cancel_token: Token of the run; cancelling it stops both attempts
+        deadline: time.monotonic() value after which a failed primary stops waiting for the hedge
+
+    Returns:
+        Tuple of (result, winner, hedged) where winner is "primary" or "hedge"
+        and hedged tells whether a duplicate request was sent
+    """
+    if hedge is None or delay is None:
+        return primary(cancel_token), "primary", False
+
+    lock = threading.Lock()
+    # "winner": (name, result) of the first success; "closed": no hedge may start any more
+    outcome: Dict[str, Any] = {}
+    hedge_done = threading.Event()
+    primary_token = cancel_token.child()
+    hedge_token = cancel_token.child()
+
+    def run_hedge() -> None:
+        with lock:
+            if outcome.get("closed"):
+                hedge_done.set()
+                return
+            outcome["fired"] = True
+        try:
+            result = hedge(hedge_token)
+        except SlotUnavailable:
+            # Every slot is busy: a duplicate would only queue behind other requests
+            with lock:
+                outcome["fired"] = False
+        except BaseException as e:
+            logger.debug(f"Hedged request failed: {e}")
+        else:
+            with lock:
+                outcome.setdefault("winner", ("hedge", result))
+                outcome["closed"] = True
+            primary_token.cancel()
+        finally:
+            hedge_done.set()
+
+    timer = threading.Timer(delay, run_hedge)
+    timer.daemon = True
+    timer.start()
+    try:
+        try:
+            result = primary(primary_token)
+        except BaseException:
+            with lock:
+                started = outcome.get("fired", False)
+                outcome["closed"] = True
+            timer.cancel()
+            if started:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not hedge_done.wait(timeout):
+                    hedge_token.cancel()
+            with lock:
+                winner = outcome.get("winner")
+                fired = outcome.get("fired", False)
+            if winner is None:
+                raise
+            return winner[1], winner[0], fired
+
+        with lock:
+            outcome.setdefault("winner", ("primary", result))
+            outcome["closed"] = True
+            fired = outcome.get("fired", False)
+        timer.cancel()
+        hedge_token.cancel()
+        name, result = outcome["winner"]
+        return result, name, fired
+    finally:
+        cancel_token.unregister(primary_token)
+        cancel_token.unregister(hedge_token)
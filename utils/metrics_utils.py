@@ -0,0 +1,372 @@
+# per-paper and per-run timing, token and cost metrics
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0-100) of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """
+    Estimate the USD cost of a call from DEFAULT_CONFIG["model_pricing"]
+
+    Args:
+        model: Model name
+        input_tokens: Prompt tokens
+        output_tokens: Completion tokens
+
+    Returns:
+        Estimated cost in USD (0.0 for models without a price)
+    """
+    input_price, output_price = DEFAULT_CONFIG["model_pricing"].get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+class PaperMetrics:
+    """Timings, token usage and retries for one paper or file"""
+
+    def __init__(self, paper_id: str = "", source: str = ""):
+        self.paper_id = paper_id
+        self.source = source
+        self.stages: Dict[str, float] = {}
+        self.calls: List[Dict[str, Any]] = []
+        self.cache_hit = False
+        # "hit" when another session's stored result was reused, "coalesced" when it was awaited in flight
+        self.shared_result: Optional[str] = None
+        # Duplicate requests sent for slow calls, how many of them answered first, and provider failover
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failover = False
+        self.error: Optional[str] = None
+        # "accepted" or "escalated" when the paper went through the model cascade,
+        # "skipped" when it was too long for the triage model
+        self.cascade: Optional[str] = None
+        self.escalation_reasons: List[str] = []
+        # How the input was shortened to fit the model's context window, if it was
+        self.input_reductions: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, float]]:
+        """Time a block and add it to the named stage; the yielded dict gets the block's 'seconds'"""
+        timing: Dict[str, float] = {}
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing["seconds"] = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + timing["seconds"]
+
+    def record_usage(
+        self,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        retries: int = 0,
+        cached_input_tokens: int = 0,
+        seconds: float = 0.0,
+        provider: Optional[str] = None
+    ) -> None:
+        """Record the provider-reported usage of one LLM call"""
+        self.calls.append({
+            "provider": provider,
+            "model": model,
+            "seconds": round(seconds, 3),
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cached_input_tokens": cached_input_tokens or 0,
+            "retries": retries or 0,
+            "cost_usd": estimate_cost(model, input_tokens or 0, output_tokens or 0),
+        })
+
+    def add_hedge(self, hedge: "PaperMetrics") -> None:
+        """
+        Fold in the metrics of a hedged duplicate request
+
+        The duplicate ran in another thread with its own collector; its stage
+        times are kept apart as hedge_* stages, and its calls are added
+        (marked as hedges) because they are billed like any other.
+        """
+        for name, seconds in list(hedge.stages.items()):
+            self.stages[f"hedge_{name}"] = self.stages.get(f"hedge_{name}", 0.0) + seconds
+        self.calls.extend({**call, "hedge": True} for call in list(hedge.calls))
+        self.input_reductions.extend(
+            reduction for reduction in hedge.input_reductions if reduction not in self.input_reductions
+        )
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(call["input_tokens"] for call in self.calls)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(call["output_tokens"] for call in self.calls)
+
+    @property
+    def retries(self) -> int:
+        return sum(call["retries"] for call in self.calls)
+
+    @property
+    def cost(self) -> float:
+        return sum(call["cost_usd"] for call in self.calls)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "paper_id": self.paper_id,
+            "source": self.source,
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "retries": self.retries,
+            "cache_hit": self.cache_hit,
+            "shared_result": self.shared_result,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failover": self.failover,
+            "cost_usd": round(self.cost, 6),
+            "calls": self.calls,
+            "cascade": self.cascade,
+            "escalation_reasons": self.escalation_reasons,
+            "input_reductions": self.input_reductions,
+            "error": self.error,
+        }
+
+class RunMetrics:
+    """Aggregates PaperMetrics for one analysis run"""
+
+    def __init__(self, source: str, provider: str, model: str, triage_model: Optional[str] = None):
+        self.source = source
+        self.provider = provider
+        self.model = model
+        self.triage_model = triage_model
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.papers: List[PaperMetrics] = []
+        self.run_stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        # Per-stage utilization when the run went through a staged pipeline
+        self.pipeline: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def new_paper(self, paper_id: str) -> PaperMetrics:
+        return PaperMetrics(paper_id, self.source)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a run-level stage, e.g. the PubMed search"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.run_stages[name] = self.run_stages.get(name, 0.0) + time.perf_counter() - start
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increment a named run counter (e.g. duplicates skipped)"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+        REGISTRY.increment_event(name, amount)
+
+    def add(self, paper: PaperMetrics) -> None:
+        """Add a finished paper, log it as a JSON line and update the process-wide registry"""
+        self.papers.append(paper)
+        logger.info(json.dumps({"event": "paper_metrics", "provider": self.provider, **paper.to_dict()}))
+        REGISTRY.observe_paper(self.provider, paper)
+        if paper.input_reductions:
+            self.increment('inputs_reduced')
+        if paper.cascade == "skipped":
+            self.increment('triage_skipped')
+        if paper.shared_result == "coalesced":
+            self.increment('coalesced_requests')
+        if paper.hedges:
+            self.increment('hedges_fired', paper.hedges)
+        if paper.hedge_wins:
+            self.increment('hedges_won', paper.hedge_wins)
+        if paper.failover:
+            self.increment('failovers')
+
+    def finish(self) -> Dict[str, Any]:
+        """Mark the run as finished, log and return its summary"""
+        self.finished = time.time()
+        for name, seconds in self.run_stages.items():
+            REGISTRY.observe_stage(name, seconds)
+        summary = self.summary()
+        # Each paper was already logged as a paper_metrics line; per_paper is kept for the download only
+        logger.info(json.dumps({"event": "run_metrics", **{key: value for key, value in summary.items() if key != "per_paper"}}))
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        wall = (self.finished or time.time()) - self.started
+        stage_samples: Dict[str, List[float]] = {}
+        for paper in self.papers:
+            for name, seconds in paper.stages.items():
+                stage_samples.setdefault(name, []).append(seconds)
+        for name, seconds in self.run_stages.items():
+            stage_samples.setdefault(name, []).append(seconds)
+        completed = [paper for paper in self.papers if not paper.error]
+        return {
+            "source": self.source,
+            "provider": self.provider,
+            "model": self.model,
+            "started": self.started,
+            "wall_s": round(wall, 2),
+            "papers": len(self.papers),
+            "completed": len(completed),
+            "errors": len(self.papers) - len(completed),
+            "papers_per_min": round(len(completed) / wall * 60, 1) if wall > 0 else 0.0,
+            "input_tokens": sum(paper.input_tokens for paper in self.papers),
+            "output_tokens": sum(paper.output_tokens for paper in self.papers),
+            "llm_calls": sum(len(paper.calls) for paper in self.papers),
+            "retries": sum(paper.retries for paper in self.papers),
+            "cache_hits": sum(1 for paper in self.papers if paper.cache_hit),
+            "cost_usd": round(sum(paper.cost for paper in self.papers), 4),
+            "stages": {
+                name: {
+                    "count": len(samples),
+                    "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                    "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                    "total_s": round(sum(samples), 2),
+                }
+                for name, samples in stage_samples.items()
+            },
+            "counters": dict(self.counters),
+            "cascade": self.cascade_summary(),
+            "pipeline": self.pipeline,
+            "per_paper": [paper.to_dict() for paper in self.papers],
+        }
+
+    def cascade_summary(self) -> Optional[Dict[str, Any]]:
+        """
+        Escalation rate and estimated savings of the triage cascade.
+
+        Savings compare each accepted paper's triage call with what the
+        flagship model would have cost, using the mean latency of flagship
+        calls seen in this run and flagship pricing for the same tokens;
+        triage calls wasted on escalated papers are subtracted.
+        """
+        if not self.triage_model:
+            return None
+        accepted = [paper for paper in self.papers if paper.cascade == "accepted"]
+        escalated = [paper for paper in self.papers if paper.cascade == "escalated"]
+        triaged = len(accepted) + len(escalated)
+        accepted_calls = [call for paper in accepted for call in paper.calls]
+        wasted_calls = [call for paper in escalated for call in paper.calls if call["model"] == self.triage_model]
+        flagship_calls = [call for paper in self.papers for call in paper.calls if call["model"] == self.model]
+
+        latency_saved = None
+        if flagship_calls:
+            flagship_latency = sum(call["seconds"] for call in flagship_calls) / len(flagship_calls)
+            latency_saved = (
+                len(accepted) * flagship_latency
+                - sum(call["seconds"] for call in accepted_calls)
+                - sum(call["seconds"] for call in wasted_calls)
+            )
+
+        cost_saved = (
+            sum(estimate_cost(self.model, call["input_tokens"], call["output_tokens"]) - call["cost_usd"] for call in accepted_calls)
+            - sum(call["cost_usd"] for call in wasted_calls)
+        )
+        return {
+            "triage_model": self.triage_model,
+            "flagship_model": self.model,
+            "triaged": triaged,
+            "accepted": len(accepted),
+            "escalated": len(escalated),
+            "escalation_rate": round(len(escalated) / triaged, 3) if triaged else 0.0,
+            "skipped": len([paper for paper in self.papers if paper.cascade == "skipped"]),
+            "estimated_latency_saved_s": round(latency_saved, 2) if latency_saved is not None else None,
+            "estimated_cost_saved_usd": round(cost_saved, 4),
+        }
+
+class MetricsRegistry:
+    """Process-wide counters across all sessions, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def _add(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def observe_paper(self, provider: str, paper: PaperMetrics) -> None:
+        self._add("clara_papers_total", 1, source=paper.source, status="error" if paper.error else "ok")
+        if paper.cache_hit:
+            self._add("clara_cache_hits_total", 1, source=paper.source)
+        for call in paper.calls:
+            # Calls carry their own provider: failover and hedges can leave the run's provider
+            labels = {"provider": call.get("provider") or provider, "model": call["model"]}
+            self._add("clara_llm_calls_total", 1, **labels)
+            self._add("clara_llm_tokens_total", call["input_tokens"], direction="input", **labels)
+            self._add("clara_llm_tokens_total", call["output_tokens"], direction="output", **labels)
+            self._add("clara_llm_retries_total", call["retries"], **labels)
+            self._add("clara_llm_cost_usd_total", call["cost_usd"], **labels)
+        for name, seconds in paper.stages.items():
+            self.observe_stage(name, seconds)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self._add("clara_stage_seconds_sum", seconds, stage=stage)
+        self._add("clara_stage_seconds_count", 1, stage=stage)
+
+    def increment_event(self, event: str, amount: int = 1) -> None:
+        self._add("clara_events_total", amount, event=event)
+
+    def render_prometheus(self) -> str:
+        """Return all values in the Prometheus text exposition format"""
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = []
+        seen = set()
+        for (name, labels), value in items:
+            family = name[:-len("_sum")] if name.endswith("_sum") else name[:-len("_count")] if name.endswith("_count") else name
+            if family not in seen:
+                seen.add(family)
+                kind = "summary" if family != name else "counter"
+                lines.append(f"# TYPE {family} {kind}")
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        payload = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve REGISTRY at http://host:port/metrics from a daemon thread
+
+    Args:
+        port: Port to listen on
+        host: Interface to bind
+
+    Returns:
+        The running server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
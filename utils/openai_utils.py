@@ -1,17 +1,22 @@
 # openai calls and prompting
 import json
-import openai
-from typing import Dict, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, TYPE_CHECKING
 import logging
+from utils.metrics_utils import PaperMetrics
+from utils.streaming_utils import CancelToken, OutputTruncated, RequestCancelled, consume_stream, request_deadline, request_timeout
+
+if TYPE_CHECKING:
+    import openai
 
 logger = logging.getLogger(__name__)
 
-def create_openai_client(api_key: str) -> openai.OpenAI:
-    """Create and return an OpenAI client"""
-    return openai.OpenAI(api_key=api_key)
+def create_openai_client(api_key: str, http_client: Optional[Any] = None) -> "openai.OpenAI":
+    """Create and return an OpenAI client, optionally on a shared httpx client"""
+    import openai
+    return openai.OpenAI(api_key=api_key, http_client=http_client)
 
-def get_analysis_prompt(is_pdf: bool = False) -> str:
-    """Get the system prompt for paper analysis"""
+def get_analysis_prompt(is_pdf: bool = False, omit_fields: Optional[List[str]] = None) -> str:
+    """Get the system prompt for paper analysis, leaving out fields filled in elsewhere"""
     system_prompt = """
     You are a bot speaking with another program that takes JSON formatted text as an input. Only return results in JSON format, with NO PREAMBLE.
     The user will input the results from a PubMed search or a full-text clinical trial PDF. Your job is to extract the exact information to return:
@@ -43,6 +48,15 @@ def get_analysis_prompt(is_pdf: bool = False) -> str:
       'Error': Error description, if any. Otherwise, leave emtpy
     """
 
+    if omit_fields:
+        system_prompt = "\n".join(
+            line for line in system_prompt.split("\n")
+            if not any(line.strip().startswith(f"'{field}'") for field in omit_fields)
+        )
+        system_prompt += f"""
+    Do not return these fields, they are filled in from PubMed metadata: {', '.join(omit_fields)}
+    """
+
     if is_pdf:
         system_prompt += """
         Note: This is a full-text PDF of a clinical trial. Extract as much detail as possible from the full text.
@@ -51,10 +65,16 @@ def get_analysis_prompt(is_pdf: bool = False) -> str:
     return system_prompt
 
 def analyze_paper_with_openai(
-    client: openai.OpenAI, 
+    client: "openai.OpenAI", 
     paper_content: Any, 
     is_pdf: bool = False, 
-    model: str = "gpt-4o"
+    model: str = "gpt-4o",
+    metrics: Optional[PaperMetrics] = None,
+    omit_fields: Optional[List[str]] = None,
+    max_tokens: int = 4096,
+    deadline: Optional[float] = None,
+    cancel_token: Optional[CancelToken] = None,
+    on_progress: Optional[Callable[[int], None]] = None
 ) -> Dict[str, Any]:
     """
     Analyze a paper using OpenAI
@@ -64,29 +84,79 @@ def analyze_paper_with_openai(
         paper_content: Content to analyze
         is_pdf: Whether the content is from a PDF
         model: OpenAI model to use
+        metrics: Collector for timings and token usage, if any
+        omit_fields: Result fields the model should not generate
+        max_tokens: Maximum tokens in the answer
+        deadline: time.monotonic() value the run must finish by; each request also has its own timeout
+        cancel_token: Token that aborts the request when cancelled
+        on_progress: Called with the number of characters streamed so far
         
     Returns:
         Analyzed paper data as dictionary
     """
+    metrics = metrics or PaperMetrics()
     try:
-        system_prompt = get_analysis_prompt(is_pdf)
+        system_prompt = get_analysis_prompt(is_pdf, omit_fields)
         
-        conversation = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": str(paper_content)
-                }
-            ]
+        parts = []
+        usage_holder = {}
+        stop_reason = {}
+
+        def handle_chunk(chunk: Any) -> int:
+            if getattr(chunk, "usage", None):
+                usage_holder["usage"] = chunk.usage
+            if not chunk.choices:
+                return 0
+            if chunk.choices[0].finish_reason:
+                stop_reason["reason"] = chunk.choices[0].finish_reason
+            text = chunk.choices[0].delta.content or ""
+            parts.append(text)
+            return len(text)
+
+        with metrics.stage("llm") as timing:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            deadline = request_deadline(deadline)
+            raw_response = client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": system_prompt
+                    },
+                    {
+                        "role": "user",
+                        "content": str(paper_content)
+                    }
+                ],
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=request_timeout("openai", deadline)
+            )
+            consume_stream("openai", raw_response.parse(), handle_chunk, deadline, cancel_token, on_progress)
+
+        usage = usage_holder.get("usage")
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        metrics.record_usage(
+            model,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+            retries=getattr(raw_response, "retries_taken", 0),
+            cached_input_tokens=getattr(prompt_details, "cached_tokens", 0),
+            seconds=timing["seconds"],
+            provider="openai"
         )
 
-        cleaned_str = conversation.choices[0].message.content.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned_str)
+        if stop_reason.get("reason") == "length":
+            raise OutputTruncated(model, max_tokens)
+
+        with metrics.stage("parse"):
+            cleaned_str = "".join(parts).replace("```json", "").replace("```", "").strip()
+            return json.loads(cleaned_str)
+    except (OutputTruncated, RequestCancelled):
+        # Handled by the caller; a cancelled request is the loser of a hedge or a stopped run, not an error
+        raise
     except Exception as e:
         logger.error(f"Error analyzing paper with OpenAI: {e}")
         raise
@@ -1,10 +1,12 @@
 import io
-import PyPDF2
-import pdf2image
-import pytesseract
-from PIL import Image
-from typing import Tuple, List, Dict, Any, BinaryIO
+import statistics
+from typing import Tuple, List, Dict, Any, BinaryIO, Optional
 import logging
+from utils.metrics_utils import PaperMetrics
+from config import DEFAULT_CONFIG
+
+# PyPDF2, pdf2image, pytesseract and PIL are imported inside the functions
+# that use them, so importing this module stays cheap on app start-up.
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +21,7 @@ def convert_pdf_to_txt_file(pdf_file: BinaryIO) -> Tuple[str, int]:
         Tuple of (extracted_text, page_count)
     """
     try:
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(pdf_file)
         text = ""
         for page in pdf_reader.pages:
@@ -28,6 +31,188 @@ def convert_pdf_to_txt_file(pdf_file: BinaryIO) -> Tuple[str, int]:
         logger.error(f"Error converting PDF to text: {e}")
         raise
 
+# Longest side of the downscaled copy used to measure skew and text size
+LAYOUT_SAMPLE_SIZE = 1200
+
+def tesseract_config() -> str:
+    """Tesseract command-line options from DEFAULT_CONFIG["ocr"]"""
+    settings = DEFAULT_CONFIG["ocr"]
+    return f"--oem {settings['oem']} --psm {settings['psm']}"
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """
+    Gray level that best separates ink from paper (Otsu's method)
+
+    Args:
+        histogram: 256-bin histogram of a grayscale image
+
+    Returns:
+        Threshold; pixels above it are paper
+    """
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+def binarize(image: Any) -> Any:
+    """Black-and-white version of a grayscale image, thresholded with Otsu's method"""
+    threshold = otsu_threshold(image.histogram())
+    return image.point(lambda level: 255 if level > threshold else 0)
+
+def _row_profile(image: Any) -> List[float]:
+    # Mean gray level of each row, computed by Pillow in C
+    from PIL import Image
+    return list(image.resize((1, image.height), Image.BOX).getdata())
+
+def estimate_skew(image: Any, max_degrees: float, step: float = 0.5) -> float:
+    """
+    Rotation in degrees that straightens the text lines of a binarized image
+
+    Text lines that run horizontally give the row profile the sharpest
+    contrast, so the angle with the highest profile variance wins.
+    """
+    from PIL import Image
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(max_degrees / step)
+    for number in range(-steps, steps + 1):
+        angle = number * step
+        profile = _row_profile(image.rotate(angle, resample=Image.NEAREST, fillcolor=255))
+        score = statistics.pvariance(profile)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+def estimate_text_height(image: Any) -> Optional[float]:
+    """
+    Median height in pixels of the text lines in a binarized, straight image
+
+    Args:
+        image: Black-and-white PIL image
+
+    Returns:
+        Line height, or None if no text lines were found
+    """
+    heights = []
+    run = 0
+    # A row with more than about 1% dark pixels belongs to a text line; speckle noise stays below that
+    for level in _row_profile(image) + [255]:
+        if level < 252:
+            run += 1
+            continue
+        # Single dark rows are rules or noise, very tall runs are figures
+        if 2 <= run <= image.height // 5:
+            heights.append(run)
+        run = 0
+    return float(statistics.median(heights)) if heights else None
+
+def analyze_layout(image: Any) -> Tuple[float, Optional[float]]:
+    """
+    Measure the skew and the text line height of a grayscale page
+
+    Both are measured on a downscaled copy, so the cost does not grow with
+    the scan resolution.
+
+    Args:
+        image: Grayscale PIL image
+
+    Returns:
+        Tuple of (rotation in degrees that straightens the page, line height in pixels of `image` or None)
+    """
+    from PIL import Image
+
+    settings = DEFAULT_CONFIG["ocr"]
+    scale = min(1.0, LAYOUT_SAMPLE_SIZE / max(image.size))
+    sample = image if scale == 1.0 else image.resize(
+        (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BOX
+    )
+    sample = binarize(sample)
+    angle = estimate_skew(sample, settings["max_skew_degrees"]) if settings["deskew"] else 0.0
+    if angle:
+        sample = sample.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+    height = estimate_text_height(sample)
+    return angle, height / scale if height else None
+
+def preprocess_for_ocr(image: Any) -> Any:
+    """
+    Prepare a page image for Tesseract
+
+    The page is converted to grayscale and contrast-stretched, rescaled so
+    text lines are about DEFAULT_CONFIG["ocr"]["target_text_height"] pixels
+    high, straightened and binarized.
+    High-resolution photos shrink considerably, and Tesseract's time
+    grows with the pixel count.
+
+    Args:
+        image: PIL image of one page
+
+    Returns:
+        Black-and-white PIL image
+    """
+    from PIL import Image, ImageOps
+
+    settings = DEFAULT_CONFIG["ocr"]
+    image = ImageOps.autocontrast(ImageOps.grayscale(image), cutoff=1)
+    angle, text_height = analyze_layout(image)
+    if text_height:
+        # Upscaling adds pixels but little detail, so it is capped
+        factor = min(1.5, settings["target_text_height"] / text_height)
+        if not 0.9 <= factor <= 1.1:
+            image = image.resize(
+                (max(1, round(image.width * factor)), max(1, round(image.height * factor))),
+                Image.LANCZOS if factor < 1 else Image.BICUBIC
+            )
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return binarize(image)
+
+def choose_ocr_dpi(pdf_file: bytes) -> int:
+    """
+    Rendering resolution for OCR of a scanned PDF
+
+    Page 1 is rendered at a low resolution to measure its text size; the
+    resolution is then chosen so text lines come out at the target height.
+
+    Args:
+        pdf_file: PDF file as bytes
+
+    Returns:
+        DPI, between the configured minimum and maximum
+    """
+    import pdf2image
+
+    settings = DEFAULT_CONFIG["ocr"]
+    probe = pdf2image.convert_from_bytes(
+        pdf_file, dpi=settings["probe_dpi"], first_page=1, last_page=1, grayscale=True
+    )
+    text_height = analyze_layout(probe[0])[1] if probe else None
+    if not text_height:
+        return settings["default_dpi"]
+    dpi = settings["probe_dpi"] * settings["target_text_height"] / text_height
+    return int(min(settings["max_dpi"], max(settings["min_dpi"], dpi)))
+
+def ocr_image(image: Any, lang: str = 'eng') -> str:
+    """OCR one page image, preprocessing it first unless DEFAULT_CONFIG["ocr"]["preprocess"] is off"""
+    import pytesseract
+
+    if DEFAULT_CONFIG["ocr"]["preprocess"]:
+        image = preprocess_for_ocr(image)
+    return pytesseract.image_to_string(image, lang=lang, config=tesseract_config())
+
 def images_to_txt(pdf_file: bytes, lang: str = 'eng') -> Tuple[List[str], int]:
     """
     Convert PDF to text using OCR
@@ -40,50 +225,79 @@ def images_to_txt(pdf_file: bytes, lang: str = 'eng') -> Tuple[List[str], int]:
         Tuple of (list_of_page_texts, page_count)
     """
     try:
-        images = pdf2image.convert_from_bytes(pdf_file)
+        import pdf2image
+        if DEFAULT_CONFIG["ocr"]["preprocess"]:
+            dpi = choose_ocr_dpi(pdf_file)
+            images = pdf2image.convert_from_bytes(pdf_file, dpi=dpi, grayscale=True)
+        else:
+            images = pdf2image.convert_from_bytes(pdf_file)
         texts = []
         for image in images:
-            text = pytesseract.image_to_string(image, lang=lang)
+            text = ocr_image(image, lang)
             texts.append(text)
         return texts, len(images)
     except Exception as e:
         logger.error(f"Error performing OCR on PDF: {e}")
         raise
 
-def process_file(file: Any, use_ocr: bool = False, language: str = 'eng') -> Dict[str, Any]:
+def extract_text(
+    filename: str,
+    file_content: bytes,
+    use_ocr: bool = False,
+    language: str = 'eng',
+    metrics: Optional[PaperMetrics] = None
+) -> Dict[str, Any]:
     """
-    Process a file (PDF or image) and extract text
+    Extract text from the bytes of a PDF or image file
     
     Args:
-        file: File object
+        filename: Name of the file; its extension selects the extractor
+        file_content: File content
         use_ocr: Whether to use OCR
         language: Language code for OCR
+        metrics: Collector for extraction/OCR timings, if any
         
     Returns:
-        Dictionary with filename and extracted content
+        Dictionary with filename, extracted content and page count
     """
-    try:
-        file_extension = file.name.split(".")[-1].lower()
-        file_content = file.read()
-        
-        if file_extension == "pdf":
-            if use_ocr:
+    metrics = metrics or PaperMetrics()
+    file_extension = filename.split(".")[-1].lower()
+    
+    if file_extension == "pdf":
+        if use_ocr:
+            with metrics.stage("ocr"):
                 texts, page_count = images_to_txt(file_content, language)
-                text_content = "\n\n".join(texts)
-            else:
+            text_content = "\n\n".join(texts)
+        else:
+            with metrics.stage("extract"):
                 text_content, page_count = convert_pdf_to_txt_file(io.BytesIO(file_content))
-        elif file_extension in ["png", "jpg", "jpeg"]:
+    elif file_extension in ["png", "jpg", "jpeg"]:
+        from PIL import Image
+        with metrics.stage("ocr"):
             pil_image = Image.open(io.BytesIO(file_content))
-            text_content = pytesseract.image_to_string(pil_image, lang=language)
-            page_count = 1
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-            
-        return {
-            'filename': file.name,
-            'content': text_content,
-            'page_count': page_count
-        }
+            text_content = ocr_image(pil_image, language)
+        page_count = 1
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+        
+    return {
+        'filename': filename,
+        'content': text_content,
+        'page_count': page_count
+    }
+
+def extract_file_worker(filename: str, file_content: bytes, use_ocr: bool, language: str) -> Dict[str, Any]:
+    """
+    Process-pool entry point for extract_text
+
+    Runs in a worker process, so it takes and returns only picklable values;
+    the stage timings come back under 'stages' for the caller's PaperMetrics.
+    """
+    metrics = PaperMetrics(filename)
+    try:
+        processed = extract_text(filename, file_content, use_ocr, language, metrics)
     except Exception as e:
-        logger.error(f"Error processing file {file.name}: {e}")
+        logger.error(f"Error processing file {filename}: {e}")
         raise
+    processed['stages'] = metrics.stages
+    return processed
@@ -0,0 +1,251 @@
+# staged worker pipelines connected by bounded queues
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Callable, Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the items on a queue
+_DONE = object()
+
+# Seconds between checks of the stop flag while waiting on a queue
+POLL_SECONDS = 0.1
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+def default_process_workers(limit: int = 4) -> int:
+    """Number of extraction processes when none is configured: the CPU count, capped"""
+    return max(1, min(limit, os.cpu_count() or 1))
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the process-wide pool for CPU-bound work, created on first use
+
+    The pool uses the spawn start method, so worker processes do not inherit
+    the app's threads or open connections. It is reused across runs and
+    sessions and is replaced if a worker process dies or the size changes.
+
+    Args:
+        workers: Number of worker processes
+
+    Returns:
+        ProcessPoolExecutor
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers or getattr(_pool, "_broken", False):
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+def run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a picklable top-level function in the shared process pool and wait for its result"""
+    pool = get_process_pool(_pool_workers or default_process_workers())
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory on a huge scan); retry once on a fresh pool
+        logger.warning("Process pool broken; restarting it")
+        return get_process_pool(_pool_workers).submit(func, *args).result()
+
+class PipelineError:
+    """An item that failed in one stage; passed to the pipeline output instead of a result"""
+
+    def __init__(self, stage: str, item: Any, error: Exception):
+        self.stage = stage
+        self.item = item
+        self.error = error
+
+class StageStats:
+    """Busy, starved and blocked time of one pipeline stage"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        # Waiting for input (upstream too slow) and waiting to hand off output (downstream too slow)
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.in_progress = 0
+        self.lock = threading.Lock()
+
+    def add(self, field: str, value: float) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        wall = ((self.finished or time.perf_counter()) - self.started) if self.started else 0.0
+        capacity = wall * self.workers
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_s": round(self.busy, 3),
+            "starved_s": round(self.starved, 3),
+            "blocked_s": round(self.blocked, 3),
+            "wall_s": round(wall, 3),
+            "utilization": round(self.busy / capacity, 3) if capacity > 0 else 0.0,
+        }
+
+class Pipeline:
+    """
+    Stages of worker threads connected by bounded queues
+
+    Each stage's function takes an item and returns the item for the next
+    stage. A full queue blocks the stage feeding it, so a slow stage holds
+    back the ones before it instead of piling up work in memory. Results of
+    the last stage, and PipelineError for items that failed in any stage,
+    are put on the unbounded `output` queue for the caller to drain.
+
+    CPU-bound stage functions should hand their work to run_in_process();
+    the stage threads then only wait on the process pool.
+    """
+
+    def __init__(self, queue_size: int = 4):
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        # True once every item has left the last stage
+        self.completed = False
+        self.output: "queue.Queue[Any]" = queue.Queue()
+        self.stages: List[StageStats] = []
+        self._funcs: List[Callable[[Any], Any]] = []
+        self._threads: List[threading.Thread] = []
+
+    def add_stage(self, name: str, func: Callable[[Any], Any], workers: int = 1) -> None:
+        """Add a stage run by `workers` threads; stages run in the order they are added"""
+        self.stages.append(StageStats(name, max(1, workers)))
+        self._funcs.append(func)
+
+    def _put(self, target: "queue.Queue[Any]", item: Any, stats: Optional[StageStats] = None) -> bool:
+        """Put an item on a bounded queue, waiting while it is full; False if the pipeline was stopped"""
+        start = time.perf_counter()
+        try:
+            while not self.stop.is_set():
+                try:
+                    target.put(item, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            if stats is not None:
+                stats.add("blocked", time.perf_counter() - start)
+
+    def _worker(
+        self,
+        stats: StageStats,
+        func: Callable[[Any], Any],
+        inbox: "queue.Queue[Any]",
+        outbox: "queue.Queue[Any]",
+        remaining: List[int]
+    ) -> None:
+        while not self.stop.is_set():
+            wait_start = time.perf_counter()
+            try:
+                item = inbox.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                stats.add("starved", time.perf_counter() - wait_start)
+                continue
+            stats.add("starved", time.perf_counter() - wait_start)
+            if item is _DONE:
+                # Let the stage's other workers see the end marker too
+                inbox.put(_DONE)
+                break
+
+            stats.add("in_progress", 1)
+            busy_start = time.perf_counter()
+            try:
+                result = func(item)
+                error = None
+            except Exception as e:
+                result, error = None, e
+            stats.add("busy", time.perf_counter() - busy_start)
+            stats.add("in_progress", -1)
+            stats.add("items", 1)
+
+            if error is not None:
+                stats.add("errors", 1)
+                self.output.put(PipelineError(stats.name, item, error))
+            elif not self._put(outbox, result, stats):
+                break
+
+        with stats.lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            stats.finished = time.perf_counter()
+            self._put(outbox, _DONE)
+
+    def start(self, items: Iterable[Any]) -> None:
+        """Start all stages and feed them the items from a background thread"""
+        inboxes = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        outboxes = inboxes[1:] + [self.output]
+        now = time.perf_counter()
+        for stats, func, inbox, outbox in zip(self.stages, self._funcs, inboxes, outboxes):
+            stats.started = now
+            remaining = [stats.workers]
+            for number in range(stats.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stats, func, inbox, outbox, remaining),
+                    name=f"pipeline-{stats.name}-{number}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+        def feed() -> None:
+            for item in items:
+                if not self._put(inboxes[0], item):
+                    return
+            self._put(inboxes[0], _DONE)
+
+        feeder = threading.Thread(target=feed, name="pipeline-feed", daemon=True)
+        feeder.start()
+        self._threads.append(feeder)
+
+    def results(self, timeout: float) -> Iterable[Any]:
+        """
+        Yield outputs as they arrive, and None whenever `timeout` passes without one
+
+        Stops after the last stage has finished or once the pipeline is stopped.
+        """
+        while not self.stop.is_set():
+            try:
+                result = self.output.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue
+            if result is _DONE:
+                self.completed = True
+                return
+            yield result
+
+    def in_progress(self) -> Dict[str, int]:
+        """Number of items each stage is working on right now"""
+        return {stats.name: stats.in_progress for stats in self.stages}
+
+    def close(self) -> None:
+        """Stop all stages; items still in the queues are dropped"""
+        self.stop.set()
+        for stats in self.stages:
+            if stats.finished is None:
+                stats.finished = time.perf_counter()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-stage utilization, keyed by stage name"""
+        return {stats.name: stats.to_dict() for stats in self.stages}
@@ -1,15 +1,82 @@
-from Bio import Entrez
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
+from config import DEFAULT_CONFIG
+
+# Bio.Entrez is imported on first use to keep app start-up fast
 
 logger = logging.getLogger(__name__)
 
+# NCBI credentials set by configure_entrez(), applied to Entrez by each PubMed request
+_entrez_credentials: Dict[str, str] = {}
+
 def configure_entrez(email: Optional[str] = None, api_key: Optional[str] = None) -> None:
-    """Configure Entrez with email and API key"""
+    """Store the Entrez email and API key; they are applied on the first PubMed request"""
     if email:
-        Entrez.email = email
+        _entrez_credentials['email'] = email
     if api_key:
-        Entrez.api_key = api_key
+        _entrez_credentials['api_key'] = api_key
+
+def _entrez() -> Any:
+    """Import Bio.Entrez and apply the configured credentials"""
+    from Bio import Entrez
+    for name, value in _entrez_credentials.items():
+        setattr(Entrez, name, value)
+    return Entrez
+
+# Most IDs a single esearch call returns
+ESEARCH_MAX_IDS = 10000
+
+def search_pubmed_ids(
+    query: str,
+    max_results: int,
+    mindate: Optional[str] = None,
+    maxdate: Optional[str] = None,
+    datetype: str = "edat"
+) -> List[str]:
+    """
+    Search PubMed and return the matching PMIDs
+    
+    Args:
+        query: PubMed search query
+        max_results: Maximum number of PMIDs to return
+        mindate: Earliest date (YYYY/MM/DD), if the search is date bounded
+        maxdate: Latest date (YYYY/MM/DD); required by esearch with mindate
+        datetype: Date the bounds apply to; "edat" is the date the record was added to PubMed
+        
+    Returns:
+        List of PMIDs
+    """
+    try:
+        Entrez = _entrez()
+        params = {"db": "pubmed", "term": query, "retmax": max_results}
+        if mindate:
+            params.update(mindate=mindate, maxdate=maxdate, datetype=datetype)
+        with Entrez.esearch(**params) as handle:
+            record = Entrez.read(handle)
+        return [str(pmid) for pmid in record["IdList"]]
+    except Exception as e:
+        logger.error(f"Error searching PubMed: {e}")
+        raise
+
+def fetch_pubmed_records(pmids: List[str]) -> Any:
+    """
+    Fetch PubMed article records by PMID
+    
+    Args:
+        pmids: PMIDs to fetch
+        
+    Returns:
+        Parsed efetch result (with 'PubmedArticle'), or an empty list for no PMIDs
+    """
+    if not pmids:
+        return []
+    try:
+        Entrez = _entrez()
+        with Entrez.efetch(db="pubmed", id=','.join(pmids), retmode="xml") as handle:
+            return Entrez.read(handle)
+    except Exception as e:
+        logger.error(f"Error fetching PubMed records: {e}")
+        raise
 
 def search_and_fetch_pubmed(query: str, max_results: int) -> List[Dict[str, Any]]:
     """
@@ -22,19 +89,148 @@ def search_and_fetch_pubmed(query: str, max_results: int) -> List[Dict[str, Any]
     Returns:
         List of PubMed article records
     """
-    try:
-        with Entrez.esearch(db="pubmed", term=query, retmax=max_results) as handle:
-            record = Entrez.read(handle)
+    return fetch_pubmed_records(search_pubmed_ids(query, max_results))
 
-        id_list = record["IdList"]
-        if not id_list:
-            return []
+# Result fields that are read straight from the efetch XML instead of asking the LLM
+DETERMINISTIC_FIELDS = [
+    'Title',
+    'PMID',
+    'Full Text Link',
+    'Main Author',
+    'Other Authors',
+    'Journal Name',
+    'Date of Publication',
+]
 
-        ids = ','.join(id_list)
-        with Entrez.efetch(db="pubmed", id=ids, retmode="xml") as handle:
-            records = Entrez.read(handle)
+MONTHS = {
+    'jan': '01', 'feb': '02', 'mar': '03', 'apr': '04', 'may': '05', 'jun': '06',
+    'jul': '07', 'aug': '08', 'sep': '09', 'oct': '10', 'nov': '11', 'dec': '12',
+}
 
-        return records
-    except Exception as e:
-        logger.error(f"Error searching PubMed: {e}")
-        raise
+def _format_date(date: Dict[str, Any]) -> str:
+    """Format an efetch PubDate/ArticleDate as YYYY-MM-DD (or YYYY-MM / YYYY when incomplete)"""
+    if 'Year' not in date:
+        # e.g. <MedlineDate>2021 Nov-Dec</MedlineDate>
+        return str(date.get('MedlineDate', ''))[:4]
+    parts = [str(date['Year'])]
+    month = str(date.get('Month', ''))
+    if month:
+        parts.append(MONTHS.get(month[:3].lower(), month.zfill(2)))
+        if date.get('Day'):
+            parts.append(str(date['Day']).zfill(2))
+    return "-".join(parts)
+
+def _format_author(author: Dict[str, Any]) -> str:
+    if 'CollectiveName' in author:
+        return str(author['CollectiveName'])
+    return f"{author.get('LastName', '')}, {author.get('Initials', '')}".strip(", ")
+
+def extract_record_metadata(paper: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read bibliographic and filtering metadata from an efetch record
+
+    Args:
+        paper: PubmedArticle record
+
+    Returns:
+        Dictionary with pmid, title, journal, authors, date, doi,
+        publication_types, mesh_terms, languages and has_abstract
+    """
+    citation = paper.get('MedlineCitation', {})
+    article = citation.get('Article', {})
+    journal = article.get('Journal', {})
+
+    doi = None
+    for article_id in paper.get('PubmedData', {}).get('ArticleIdList', []):
+        if getattr(article_id, 'attributes', {}).get('IdType') == 'doi':
+            doi = str(article_id)
+    if doi is None:
+        for location in article.get('ELocationID', []):
+            if getattr(location, 'attributes', {}).get('EIdType') == 'doi':
+                doi = str(location)
+
+    date = _format_date(journal.get('JournalIssue', {}).get('PubDate', {}))
+    article_dates = article.get('ArticleDate', [])
+    if len(date) < 10 and article_dates:
+        # The electronic publication date is usually complete when the issue date is not
+        date = _format_date(article_dates[0]) or date
+
+    abstract = article.get('Abstract', {}).get('AbstractText', [])
+    return {
+        'pmid': str(citation.get('PMID', '')),
+        'title': str(article.get('ArticleTitle', '')),
+        'journal': str(journal.get('Title', '')),
+        'authors': [_format_author(author) for author in article.get('AuthorList', [])],
+        'date': date,
+        'doi': doi,
+        'publication_types': [str(pub_type) for pub_type in article.get('PublicationTypeList', [])],
+        'mesh_terms': [str(heading.get('DescriptorName', '')) for heading in citation.get('MeshHeadingList', [])],
+        'languages': [str(language) for language in article.get('Language', [])],
+        'has_abstract': any(str(text).strip() for text in abstract),
+    }
+
+def deterministic_fields(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Map extract_record_metadata() output to the result columns in DETERMINISTIC_FIELDS"""
+    authors = metadata['authors']
+    return {
+        'Title': metadata['title'],
+        'PMID': metadata['pmid'] or 'NA',
+        'Full Text Link': f"https://doi.org/{metadata['doi']}" if metadata['doi'] else 'NA',
+        'Main Author': authors[0] if authors else '',
+        'Other Authors': "; ".join(authors[1:]),
+        'Journal Name': metadata['journal'],
+        'Date of Publication': metadata['date'],
+    }
+
+def prefilter_reason(metadata: Dict[str, Any], rules: Dict[str, Any]) -> Optional[str]:
+    """
+    Apply prefilter rules to one record's metadata
+
+    Args:
+        metadata: Output of extract_record_metadata()
+        rules: Rules as in DEFAULT_CONFIG["pubmed_prefilter"]
+
+    Returns:
+        Reason the record is excluded, or None to keep it
+    """
+    publication_types = set(metadata['publication_types'])
+    if rules.get('require_abstract') and not metadata['has_abstract']:
+        return "no abstract"
+    excluded_types = publication_types & set(rules.get('exclude_publication_types', []))
+    if excluded_types:
+        return f"publication type: {', '.join(sorted(excluded_types))}"
+    included_types = rules.get('include_publication_types', [])
+    if included_types and not publication_types & set(included_types):
+        return "publication type not in the allowed list"
+    if rules.get('exclude_non_human'):
+        mesh_terms = set(metadata['mesh_terms'])
+        if 'Animals' in mesh_terms and 'Humans' not in mesh_terms:
+            return "non-human (MeSH)"
+    # Rules may name languages ("French") or give MEDLINE codes ("fre")
+    languages = [DEFAULT_CONFIG["pubmed_languages"].get(language, language) for language in rules.get('languages', [])]
+    if languages and not set(metadata['languages']) & set(languages):
+        return f"language: {', '.join(metadata['languages'])}"
+    return None
+
+def prefilter_records(
+    records: List[Dict[str, Any]],
+    rules: Dict[str, Any]
+) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
+    """
+    Split efetch records into those to analyze and those excluded by the rules
+
+    Args:
+        records: PubmedArticle records
+        rules: Rules as in DEFAULT_CONFIG["pubmed_prefilter"]
+
+    Returns:
+        Tuple of (kept_records, [(excluded_record, reason), ...])
+    """
+    kept, excluded = [], []
+    for paper in records:
+        reason = prefilter_reason(extract_record_metadata(paper), rules)
+        if reason:
+            excluded.append((paper, reason))
+        else:
+            kept.append(paper)
+    return kept, excluded
@@ -0,0 +1,123 @@
+# saved PubMed queries on disk, refreshed incrementally
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, Any, Optional
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+def saved_queries_dir() -> str:
+    """Directory holding one JSON file per saved query"""
+    return os.path.join(DEFAULT_CONFIG["data_dir"], "saved_queries")
+
+def _query_path(name: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "query"
+    return os.path.join(saved_queries_dir(), f"{slug}.json")
+
+def new_saved_query(
+    name: str,
+    query: str,
+    max_results: int,
+    prefilter: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Create a saved query that has not been run yet
+
+    Args:
+        name: Display name; also determines the file name
+        query: PubMed search query
+        max_results: Most new papers analyzed per refresh
+        prefilter: Prefilter rules applied on refresh, or None
+
+    Returns:
+        Saved query dictionary
+    """
+    return {
+        "name": name,
+        "query": query,
+        "max_results": max_results,
+        "prefilter": prefilter,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        # Date (YYYY/MM/DD) of the last search; refreshes only look at records added since
+        "last_run": None,
+        # PMIDs already handled (analyzed, pre-filtered or duplicates) and never fetched again
+        "known_pmids": [],
+        # PMIDs found but not handled yet (errors, cancelled runs, over the per-refresh limit)
+        "pending_pmids": [],
+        "results": [],
+        "history": [],
+    }
+
+def saved_query_from_results(
+    name: str,
+    query: str,
+    max_results: int,
+    prefilter: Optional[Dict[str, Any]],
+    results: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Create a saved query from a finished search, so the next refresh starts from today"""
+    saved = new_saved_query(name, query, max_results, prefilter)
+    saved["results"] = list(results)
+    saved["known_pmids"] = sorted({str(result.get('PMID', '')) for result in results if str(result.get('PMID', '')).isdigit()})
+    saved["last_run"] = time.strftime("%Y/%m/%d")
+    return saved
+
+def save_query(saved: Dict[str, Any]) -> None:
+    """
+    Write a saved query to disk, replacing the file atomically
+
+    Raises:
+        ValueError: If another saved query's name maps to the same file name
+    """
+    path = _query_path(saved["name"])
+    try:
+        with open(path, encoding="utf-8") as f:
+            existing_name = json.load(f).get("name")
+    except (OSError, ValueError):
+        existing_name = None
+    if existing_name is not None and existing_name != saved["name"]:
+        raise ValueError(f"The name '{saved['name']}' is too similar to the saved query '{existing_name}'; choose another name")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+def load_saved_query(name: str) -> Optional[Dict[str, Any]]:
+    """Load a saved query by name, or None if it does not exist"""
+    try:
+        with open(_query_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def list_saved_queries() -> List[Dict[str, Any]]:
+    """All saved queries, most recently run first"""
+    directory = saved_queries_dir()
+    if not os.path.isdir(directory):
+        return []
+    queries = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                queries.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable saved query {filename}: {e}")
+    return sorted(queries, key=lambda saved: saved.get("last_run") or "", reverse=True)
+
+def delete_saved_query(name: str) -> None:
+    """Delete a saved query; missing queries are ignored"""
+    try:
+        os.remove(_query_path(name))
+    except FileNotFoundError:
+        pass
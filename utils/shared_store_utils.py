@@ -0,0 +1,180 @@
+# process-wide result sharing and provider concurrency limits across sessions
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Seconds between cancellation checks while waiting for a slot or another session's result
+WAIT_POLL_SECONDS = 0.1
+
+class SlotUnavailable(Exception):
+    """No concurrency slot was free for a request that does not wait for one"""
+
+def request_key(provider: str, model: str, system_prompt: str, content: Any) -> str:
+    """Hash everything that determines an extraction: provider, model, prompt variant and paper content"""
+    digest = hashlib.sha256()
+    for part in (provider, model, system_prompt, str(content)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class SharedResultStore:
+    """
+    Analysis results shared by every session in this process
+
+    Finished results are kept in an LRU with a time-to-live. A request for a
+    key that another session is computing right now waits for that result
+    instead of making a second call. Callers always get their own copy.
+    """
+
+    def __init__(self, max_entries: int = 2000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        # Caller holds the lock
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._results[key]
+            return False, None
+        self._results.move_to_end(key)
+        return True, result
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        check_cancelled: Optional[Callable[[], None]] = None
+    ) -> Tuple[Any, str]:
+        """
+        Return the stored result for a key, computing it at most once across sessions
+
+        Args:
+            key: Output of request_key()
+            compute: Makes the request; called only if no result is stored or in flight
+            check_cancelled: Raises if the caller was cancelled while waiting on another session
+
+        Returns:
+            Tuple of (result, source) where source is "hit", "coalesced" or "miss"
+        """
+        while True:
+            with self._lock:
+                found, result = self._lookup(key)
+                if found:
+                    return copy.deepcopy(result), "hit"
+                future = self._in_flight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._in_flight[key] = Future()
+
+            if owner:
+                try:
+                    result = compute()
+                except BaseException as e:
+                    with self._lock:
+                        del self._in_flight[key]
+                    future.set_exception(e)
+                    raise
+                with self._lock:
+                    del self._in_flight[key]
+                    self._results[key] = (time.monotonic(), result)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+                future.set_result(result)
+                return copy.deepcopy(result), "miss"
+
+            while True:
+                if check_cancelled:
+                    check_cancelled()
+                try:
+                    result = future.result(timeout=WAIT_POLL_SECONDS)
+                    return copy.deepcopy(result), "coalesced"
+                except FutureTimeoutError:
+                    continue
+                except BaseException:
+                    # The other session's request failed or was cancelled; try again ourselves
+                    break
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent LLM requests per provider and per model across all sessions
+
+    Limits come from DEFAULT_CONFIG["llm_concurrency"]; a provider or model
+    without a limit is not capped. The limits hold within one server process.
+    """
+
+    def __init__(self, provider_limits: Dict[str, int], model_limits: Dict[str, int]):
+        self._semaphores = {
+            ("provider", name): threading.BoundedSemaphore(limit) for name, limit in provider_limits.items() if limit
+        }
+        self._semaphores.update({
+            ("model", name): threading.BoundedSemaphore(limit) for name, limit in model_limits.items() if limit
+        })
+
+    def _acquire(self, semaphore: threading.BoundedSemaphore, check_cancelled: Optional[Callable[[], None]]) -> None:
+        while not semaphore.acquire(timeout=WAIT_POLL_SECONDS):
+            if check_cancelled:
+                check_cancelled()
+
+    @contextmanager
+    def slot(
+        self,
+        provider: str,
+        model: str,
+        check_cancelled: Optional[Callable[[], None]] = None,
+        wait: bool = True
+    ) -> Iterator[float]:
+        """
+        Hold a provider slot and a model slot for the duration of one request
+
+        Args:
+            provider: "openai" or "anthropic"
+            model: Model name
+            check_cancelled: Raises if the caller was cancelled while waiting for a slot
+            wait: If False, raise SlotUnavailable instead of waiting when a slot is taken
+
+        Yields:
+            Seconds spent waiting for the slots
+        """
+        held = []
+        start = time.perf_counter()
+        try:
+            # Always provider first, then model, so two requests never wait on each other's slots
+            for key in (("provider", provider), ("model", model)):
+                semaphore = self._semaphores.get(key)
+                if semaphore is not None:
+                    if wait:
+                        self._acquire(semaphore, check_cancelled)
+                    elif not semaphore.acquire(blocking=False):
+                        raise SlotUnavailable(f"No free {key[0]} slot for {key[1]}")
+                    held.append(semaphore)
+            yield time.perf_counter() - start
+        finally:
+            for semaphore in reversed(held):
+                semaphore.release()
+
+RESULT_STORE = SharedResultStore(
+    DEFAULT_CONFIG["shared_results"]["max_entries"],
+    DEFAULT_CONFIG["shared_results"]["ttl"]
+)
+LIMITER = ConcurrencyLimiter(
+    DEFAULT_CONFIG["llm_concurrency"]["providers"],
+    DEFAULT_CONFIG["llm_concurrency"]["models"]
+)
@@ -0,0 +1,156 @@
+# disk-backed store for extracted texts, so sessions hold keys instead of full texts
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from typing import List, Optional, Tuple
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+class TextStore:
+    """
+    Gzip-compressed texts on disk, keyed by the SHA-256 of the text
+
+    Identical texts (the same PDF uploaded by several users) are stored once.
+    Texts not stored again for `max_age` seconds are removed by prune(),
+    which put() also starts in the background at most every `prune_interval`
+    seconds, so a long-running server does not keep expired texts.
+    """
+
+    def __init__(self, directory: str, max_age: Optional[float] = None, prune_interval: float = 3600):
+        self.directory = directory
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._prune_lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def _maybe_prune(self) -> None:
+        if not self.max_age or time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        if not self._prune_lock.acquire(blocking=False):
+            return  # another thread is starting or running a prune
+
+        def run() -> None:
+            try:
+                removed = self.prune()
+                if removed:
+                    logger.info(f"Removed {removed} expired text(s) from {self.directory}")
+            except Exception as e:
+                logger.warning(f"Pruning {self.directory} failed: {e}")
+            finally:
+                self._last_prune = time.monotonic()
+                self._prune_lock.release()
+
+        threading.Thread(target=run, name="text-store-prune", daemon=True).start()
+
+    def _path(self, key: str) -> str:
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            raise KeyError(f"Invalid text key: {key!r}")
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.txt.gz")
+
+    def put(self, text: str) -> str:
+        """Store a text and return its key"""
+        self._maybe_prune()
+        data = text.encode("utf-8")
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            # Refresh the age so prune() keeps texts that are still in use
+            os.utime(path)
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return key
+
+    def get(self, key: str) -> str:
+        """Load a text by key; raises KeyError if it is not (or no longer) stored"""
+        try:
+            with gzip.open(self._path(key), "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def write_zip(self, entries: List[Tuple[str, str]]) -> str:
+        """
+        Write texts into a ZIP file in the temp directory, one entry at a time
+
+        Each text is streamed from its gzip file into the archive, so memory
+        use does not grow with the number or size of the texts.
+
+        Args:
+            entries: (name inside the archive, text key) pairs
+
+        Returns:
+            Path of the ZIP file; the caller deletes it
+        """
+        fd, zip_path = tempfile.mkstemp(suffix=".zip")
+        os.close(fd)
+        used_names = set()
+        try:
+            with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for name, key in entries:
+                    # Uploads can share a file name
+                    base, extension = os.path.splitext(name)
+                    unique, number = name, 1
+                    while unique in used_names:
+                        number += 1
+                        unique = f"{base} ({number}){extension}"
+                    used_names.add(unique)
+                    try:
+                        with gzip.open(self._path(key), "rb") as source, archive.open(unique, "w") as target:
+                            shutil.copyfileobj(source, target)
+                    except FileNotFoundError:
+                        logger.warning(f"Text for {name} has expired from the store; leaving it out of the ZIP")
+        except Exception:
+            os.unlink(zip_path)
+            raise
+        return zip_path
+
+    def prune(self) -> int:
+        """Delete texts older than max_age; returns the number removed"""
+        if not self.max_age:
+            return 0
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+_store_lock = threading.Lock()
+_store: Optional[TextStore] = None
+
+def get_text_store() -> TextStore:
+    """Return the process-wide text store, pruning expired texts when it is first opened"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TextStore(
+                os.path.join(DEFAULT_CONFIG["data_dir"], "texts"),
+                max_age=DEFAULT_CONFIG["text_store_max_age_days"] * 86400
+            )
+            removed = _store.prune()
+            if removed:
+                logger.info(f"Removed {removed} expired text(s) from {_store.directory}")
+        return _store
@@ -0,0 +1,178 @@
+# streamed LLM responses with deadlines, stall detection and cancellation
+import importlib
+import threading
+import time
+from typing import Any, Callable, Optional, Set
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+class RequestCancelled(Exception):
+    """The request was cancelled while in flight"""
+
+class DeadlineExceeded(Exception):
+    """The request or run ran past its deadline"""
+
+class StreamStalled(DeadlineExceeded):
+    """No data arrived on the response stream within the stall timeout"""
+
+class OutputTruncated(Exception):
+    """The answer reached max_tokens before it was complete"""
+
+    def __init__(self, model: str, max_tokens: int):
+        super().__init__(f"Output of {model} was truncated at max_tokens={max_tokens}")
+        self.model = model
+        self.max_tokens = max_tokens
+
+class CancelToken:
+    """
+    Cancels in-flight streamed requests from any thread.
+
+    Streams registered while a request is running are closed on cancel(),
+    which aborts the blocked socket read immediately.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._streams: Set[Any] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+        with self._lock:
+            streams = list(self._streams)
+        for stream in streams:
+            try:
+                stream.close()
+            except Exception as e:
+                logger.debug(f"Error closing cancelled stream: {e}")
+
+    def register(self, stream: Any) -> None:
+        with self._lock:
+            self._streams.add(stream)
+        # Cancelled between the request being sent and the stream being registered
+        if self.cancelled:
+            stream.close()
+
+    def unregister(self, stream: Any) -> None:
+        with self._lock:
+            self._streams.discard(stream)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise RequestCancelled("Request cancelled")
+
+    def child(self) -> "CancelToken":
+        """
+        Return a token that is cancelled with this one but can also be cancelled on its own
+
+        Used to stop one of several requests racing for the same answer. The
+        caller unregisters the child once it is no longer needed.
+        """
+        child = CancelToken()
+        self.register(child)
+        return child
+
+    def close(self) -> None:
+        # Lets a child token be registered like a stream
+        self.cancel()
+
+def sdk_httpx(provider: str) -> Any:
+    """
+    Return the httpx package the provider's SDK runs on
+
+    SDK releases may move to a renamed fork of httpx (anthropic 1.x uses
+    httpx2), whose clients, timeouts and errors are not interchangeable with
+    httpx's. The SDK re-exports its Timeout class, which tells which package it is.
+
+    Args:
+        provider: "openai" or "anthropic"
+
+    Returns:
+        The httpx (or httpx-compatible) module
+    """
+    sdk = importlib.import_module("openai" if provider == "openai" else "anthropic")
+    return importlib.import_module(sdk.Timeout.__module__.split(".")[0])
+
+def request_deadline(run_deadline: Optional[float] = None) -> float:
+    """Deadline for a request starting now: the per-request timeout, capped by the run deadline"""
+    deadline = time.monotonic() + DEFAULT_CONFIG["llm_request_timeout"]
+    return deadline if run_deadline is None else min(deadline, run_deadline)
+
+def request_timeout(provider: str, deadline: float) -> Any:
+    """
+    Build the httpx timeout for one streamed request
+
+    The read timeout is the stall timeout: the longest gap allowed between
+    two chunks of the response. Every phase is capped by the time left
+    before the deadline; the deadline itself is enforced by consume_stream().
+
+    Args:
+        provider: "openai" or "anthropic"; the timeout comes from the httpx package its SDK runs on
+        deadline: time.monotonic() value the request must finish by
+
+    Returns:
+        Timeout of the SDK's httpx package
+    """
+    httpx = sdk_httpx(provider)
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline passed before the request was sent")
+    return httpx.Timeout(
+        remaining,
+        connect=min(DEFAULT_CONFIG["http_pool"]["connect_timeout"], remaining),
+        read=min(DEFAULT_CONFIG["llm_stall_timeout"], remaining)
+    )
+
+def consume_stream(
+    provider: str,
+    stream: Any,
+    handle_event: Callable[[Any], int],
+    deadline: Optional[float] = None,
+    cancel_token: Optional[CancelToken] = None,
+    on_progress: Optional[Callable[[int], None]] = None
+) -> None:
+    """
+    Iterate a provider response stream, enforcing the deadline and cancellation
+
+    Args:
+        provider: "openai" or "anthropic"; stalls are read timeouts of the httpx package its SDK runs on
+        stream: openai/anthropic Stream object
+        handle_event: Called with each event; returns the number of text characters it added
+        deadline: time.monotonic() value the request must finish by, if any
+        cancel_token: Token that aborts the stream when cancelled
+        on_progress: Called with the total characters received so far
+    """
+    httpx = sdk_httpx(provider)
+
+    if cancel_token:
+        cancel_token.register(stream)
+    received = 0
+    try:
+        for event in stream:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            if deadline is not None and time.monotonic() > deadline:
+                raise DeadlineExceeded("Request deadline exceeded while streaming")
+            received += handle_event(event)
+            if on_progress:
+                on_progress(received)
+    except (RequestCancelled, DeadlineExceeded):
+        raise
+    except httpx.ReadTimeout as e:
+        raise StreamStalled(f"No data for {DEFAULT_CONFIG['llm_stall_timeout']} s") from e
+    except Exception as e:
+        # Closing the stream from another thread surfaces as a read error here
+        if cancel_token and cancel_token.cancelled:
+            raise RequestCancelled("Request cancelled") from e
+        raise
+    finally:
+        if cancel_token:
+            cancel_token.unregister(stream)
+        stream.close()
@@ -0,0 +1,164 @@
+# local token counting and per-model context budgets
+import math
+import re
+from functools import lru_cache
+from typing import List, Any, Optional, Tuple
+import logging
+from config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+AUTO_MODEL = "auto"
+
+# Reference list headings; everything after the last one in the second half of a text is dropped first
+REFERENCES_PATTERN = re.compile(
+    r"^\s*(?:\d+\.?\s*)?(references|bibliography|literature cited|works cited)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+SCHEMA_FIELD_PATTERN = re.compile(r"^\s*'[^']+'", re.MULTILINE)
+TRUNCATION_MARKER = "\n\n[... middle of the text omitted to fit the model's context window ...]\n\n"
+
+# Share of a truncated text kept from its start; the rest comes from the end (results, conclusions)
+TRUNCATION_HEAD_SHARE = 0.7
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> Any:
+    """tiktoken encoding for an OpenAI model, or None if tiktoken, the model or its BPE file is unavailable"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return None
+    except Exception as e:
+        # The BPE file is downloaded on first use, which fails offline or behind a proxy;
+        # the result is cached, so this is logged and retried once per model, not per paper
+        logger.warning(f"tiktoken encoding for {model} unavailable ({e}); estimating tokens from characters")
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Count the tokens of a text for a model without calling the API
+
+    OpenAI models are counted exactly with tiktoken. Other models (and
+    OpenAI models when tiktoken is not installed) use a conservative
+    characters-per-token estimate from DEFAULT_CONFIG["token_budget"].
+
+    Args:
+        text: Text to count
+        model: Model the text is sent to
+
+    Returns:
+        Number of tokens
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / DEFAULT_CONFIG["token_budget"]["chars_per_token"])
+
+def model_limits(model: str) -> Tuple[int, int]:
+    """Return (context window, maximum output tokens) for a model"""
+    return DEFAULT_CONFIG["model_limits"].get(model, DEFAULT_CONFIG["model_limits"]["default"])
+
+def output_budget(system_prompt: str, model: str) -> int:
+    """Size max_tokens to the number of fields the prompt asks for, capped by the model's output limit"""
+    budget = DEFAULT_CONFIG["token_budget"]
+    fields = len(SCHEMA_FIELD_PATTERN.findall(system_prompt))
+    return min(model_limits(model)[1], budget["output_overhead"] + fields * budget["output_per_field"])
+
+def input_budget(system_prompt: str, model: str, max_tokens: int) -> int:
+    """Tokens left for the paper once the system prompt, message overhead and output are reserved"""
+    context = model_limits(model)[0]
+    return context - max_tokens - count_tokens(system_prompt, model) - DEFAULT_CONFIG["token_budget"]["message_overhead"]
+
+def drop_references(text: str) -> Optional[str]:
+    """Cut the reference list off a paper, or return None if none is found in its second half"""
+    headings = [match for match in REFERENCES_PATTERN.finditer(text) if match.start() > len(text) / 2]
+    if not headings:
+        return None
+    return text[:headings[-1].start()].rstrip()
+
+def truncate_middle(text: str, max_tokens: int, model: str) -> str:
+    """Keep the start and the end of a text and drop its middle so it fits in max_tokens"""
+    tokens = count_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    marker_tokens = count_tokens(TRUNCATION_MARKER, model)
+    keep_chars = len(text)
+    while keep_chars > 0:
+        # Scale by the observed chars/token ratio, with a little headroom so this rarely loops
+        keep_chars = int(keep_chars * (max_tokens - marker_tokens) / tokens * 0.97)
+        head = int(keep_chars * TRUNCATION_HEAD_SHARE)
+        candidate = text[:head] + TRUNCATION_MARKER + text[len(text) - (keep_chars - head):]
+        tokens = count_tokens(candidate, model)
+        if tokens <= max_tokens:
+            return candidate
+    return ""
+
+def fit_content(content: Any, system_prompt: str, model: str, max_tokens: int) -> Tuple[Any, List[str]]:
+    """
+    Reduce a paper until it fits the model's context window
+
+    The reference list is dropped first, then whitespace is collapsed, and
+    only then is the middle of the text cut out.
+
+    Args:
+        content: PubMed record or extracted PDF text
+        system_prompt: System prompt sent with the paper
+        model: Model the paper is sent to
+        max_tokens: Output tokens reserved for the answer
+
+    Returns:
+        Tuple of (content to send, list of reductions applied); the content is
+        returned unchanged with no reductions when it already fits
+    """
+    budget = input_budget(system_prompt, model, max_tokens)
+    text = str(content)
+    if count_tokens(text, model) <= budget:
+        return content, []
+
+    reductions = []
+    without_references = drop_references(text)
+    if without_references is not None:
+        text = without_references
+        reductions.append("references dropped")
+        if count_tokens(text, model) <= budget:
+            return text, reductions
+
+    collapsed = re.sub(r"[ \t]+", " ", re.sub(r"\n\s*\n+", "\n\n", text))
+    if collapsed != text:
+        text = collapsed
+        reductions.append("whitespace collapsed")
+        if count_tokens(text, model) <= budget:
+            return text, reductions
+
+    text = truncate_middle(text, budget, model)
+    reductions.append(f"truncated to {budget:,} tokens")
+    return text, reductions
+
+def fits(content: Any, system_prompt: str, model: str) -> bool:
+    """True if the paper fits the model's context window without any reduction"""
+    max_tokens = output_budget(system_prompt, model)
+    return count_tokens(str(content), model) <= input_budget(system_prompt, model, max_tokens)
+
+def select_model(content: Any, system_prompt: str, models: List[str]) -> str:
+    """
+    Pick the cheapest model whose context window fits the paper
+
+    Args:
+        content: PubMed record or extracted PDF text
+        system_prompt: System prompt sent with the paper
+        models: Candidate models of one provider
+
+    Returns:
+        The cheapest fitting model by input price, or the model with the
+        largest context window (cheapest first) when none fits
+    """
+    pricing = DEFAULT_CONFIG["model_pricing"]
+    by_price = sorted(models, key=lambda model: pricing.get(model, (math.inf, math.inf)))
+    for model in by_price:
+        if fits(content, system_prompt, model):
+            return model
+    return max(by_price, key=lambda model: model_limits(model)[0])
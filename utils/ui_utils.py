@@ -3,6 +3,8 @@ import pandas as pd
 from typing import Dict, List, Any, Optional
 import time
 import io
+import json
+import os
 
 def initialize_session_state():
     """Initialize all session state variables"""
@@ -30,6 +32,16 @@ def initialize_session_state():
         st.session_state['show_new_search_dialog'] = False
     if 'search_action' not in st.session_state:
         st.session_state['search_action'] = None
+    if 'run_metrics' not in st.session_state:
+        st.session_state['run_metrics'] = None
+    if 'dedup_index' not in st.session_state:
+        st.session_state['dedup_index'] = None
+    if 'cancel_token' not in st.session_state:
+        st.session_state['cancel_token'] = None
+    if 'run_stop_reason' not in st.session_state:
+        st.session_state['run_stop_reason'] = None
+    if 'results_query' not in st.session_state:
+        st.session_state['results_query'] = None
 
 def reset_app_state():
     """Reset all session state variables to their defaults"""
@@ -43,6 +55,33 @@ def reset_app_state():
     st.session_state['show_clear_confirmation'] = False
     st.session_state['show_new_search_dialog'] = False
     st.session_state['search_action'] = None
+    st.session_state['run_metrics'] = None
+    st.session_state['dedup_index'] = None
+    st.session_state['run_stop_reason'] = None
+    st.session_state['results_query'] = None
+
+def cancel_run():
+    """Cancel the running analysis; results completed so far are kept"""
+    token = st.session_state.get('cancel_token')
+    if token is not None:
+        token.cancel()
+    st.session_state['run_stop_reason'] = "cancelled"
+    if st.session_state.get('analysis_results'):
+        st.session_state['search_completed'] = True
+
+def display_cancel_button():
+    """Display the Cancel button for a running analysis; returns its placeholder, to be emptied when the run ends"""
+    # Clicking it makes Streamlit interrupt the running script; the service then aborts the request in flight
+    placeholder = st.empty()
+    placeholder.button("Cancel analysis", key="cancel_run", on_click=cancel_run)
+    return placeholder
+
+def display_run_stopped_warning(reason: Optional[str], completed: int):
+    """Explain why the last run stopped early"""
+    if reason == "cancelled":
+        st.warning(f"Analysis cancelled. {completed} completed result(s) were kept.")
+    elif reason == "deadline":
+        st.warning(f"Run time limit reached. {completed} completed result(s) were kept; the remaining papers were not analyzed.")
 
 def display_confirmation_dialog():
     """Display confirmation dialog for clearing results"""
@@ -162,18 +201,116 @@ def display_results_table_and_download(results: List[Dict[str, Any]], tab_select
         else:
             col2.write("Select rows to enable partial download")
 
-def display_pdf_text_downloads(pdf_texts: List[Dict[str, str]]):
-    """Display download buttons for extracted PDF texts"""
+def display_pdf_text_downloads(pdf_texts: List[Dict[str, Any]]):
+    """
+    Display downloads for extracted PDF texts, read from the text store only when requested
+
+    A download is built only in the run triggered by its Prepare click, so
+    unrelated reruns do not reload the text or rebuild the ZIP.
+    """
     if pdf_texts:
+        from utils.storage_utils import get_text_store
+
         st.write("### Download Extracted Text:")
+        store = get_text_store()
+        # Set only in the run a Prepare button was clicked
+        prepared = None
         
-        for i, pdf_text in enumerate(pdf_texts):
-            col1, col2 = st.columns([3, 1])
-            col1.write(f"{i+1}. {pdf_text['filename']}")
-            col2.download_button(
-                label="Download Text",
-                data=pdf_text['content'],
-                file_name=f"{pdf_text['filename']}.txt",
-                mime="text/plain",
-                key=f"download_text_{i}"
+        col1, col2 = st.columns([3, 1])
+        index = col1.selectbox(
+            "File",
+            range(len(pdf_texts)),
+            format_func=lambda i: f"{i+1}. {pdf_texts[i]['filename']} ({pdf_texts[i]['chars']:,} characters)",
+            label_visibility="collapsed"
+        )
+        pdf_text = pdf_texts[index]
+        if col2.button("Prepare Text Download", key="prepare_text_download"):
+            prepared = ("text", pdf_text['text_key'])
+        if prepared == ("text", pdf_text['text_key']):
+            try:
+                col2.download_button(
+                    label="Download Text",
+                    data=store.get(pdf_text['text_key']),
+                    file_name=f"{pdf_text['filename']}.txt",
+                    mime="text/plain",
+                    key="download_text"
+                )
+            except KeyError:
+                col2.warning("This text has expired; process the file again.")
+        
+        col1, col2 = st.columns([3, 1])
+        col1.write(f"All {len(pdf_texts)} text(s) as one ZIP file")
+        if col2.button("Prepare ZIP Download", key="prepare_zip_download"):
+            prepared = ("zip", None)
+        if prepared == ("zip", None):
+            zip_path = store.write_zip([(f"{pdf_text['filename']}.txt", pdf_text['text_key']) for pdf_text in pdf_texts])
+            try:
+                with open(zip_path, "rb") as zip_file:
+                    col2.download_button(
+                        label="Download ZIP",
+                        data=zip_file,
+                        file_name=f"PDF_Texts_{time.strftime('%y%m%d')}.zip",
+                        mime="application/zip",
+                        key="download_text_zip"
+                    )
+            finally:
+                os.remove(zip_path)
+
+def display_run_metrics(summary: Optional[Dict[str, Any]]):
+    """Display timings, token usage and cost of the last analysis run"""
+    if not summary:
+        return
+
+    from utils.metrics_utils import REGISTRY
+
+    with st.expander("Run metrics"):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Papers", f"{summary['completed']}/{summary['papers']}")
+        col2.metric("Wall time", f"{summary['wall_s']} s")
+        col3.metric("Papers/min", summary['papers_per_min'])
+        col4.metric("Est. cost", f"${summary['cost_usd']:.4f}")
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Input tokens", f"{summary['input_tokens']:,}")
+        col2.metric("Output tokens", f"{summary['output_tokens']:,}")
+        col3.metric("Retries", summary['retries'])
+        col4.metric("Cache hits", summary['cache_hits'])
+
+        if summary['stages']:
+            st.write("Time per stage:")
+            st.dataframe(
+                pd.DataFrame.from_dict(summary['stages'], orient="index"),
+                use_container_width=True
+            )
+        if summary.get('pipeline'):
+            st.write("Pipeline stage utilization (starved = waiting for input, blocked = waiting on the next stage):")
+            st.dataframe(
+                pd.DataFrame.from_dict(summary['pipeline'], orient="index"),
+                use_container_width=True
+            )
+        cascade = summary.get('cascade')
+        if cascade and cascade['triaged']:
+            saved = cascade['estimated_latency_saved_s']
+            st.write(
+                f"Cascade ({cascade['triage_model']} → {cascade['flagship_model']}): "
+                f"{cascade['escalated']}/{cascade['triaged']} escalated ({cascade['escalation_rate']:.0%}), "
+                f"est. {saved if saved is not None else 'n/a'} s and ${cascade['estimated_cost_saved_usd']:.4f} saved"
             )
+        if summary['counters']:
+            st.write(", ".join(f"{name.replace('_', ' ')}: {value}" for name, value in summary['counters'].items()))
+
+        col1, col2 = st.columns(2)
+        col1.download_button(
+            label="Download Metrics (JSON)",
+            data=json.dumps(summary, indent=2),
+            file_name=f"run_metrics_{time.strftime('%y%m%d_%H%M%S', time.localtime(summary['started']))}.json",
+            mime="application/json",
+            key="download_run_metrics"
+        )
+        col2.download_button(
+            label="Download Metrics (Prometheus)",
+            data=REGISTRY.render_prometheus(),
+            file_name="metrics.prom",
+            mime="text/plain",
+            key="download_prometheus_metrics"
+        )